@@ -1,4 +1,5 @@
 import tomllib
+from typing import Literal
 
 from pydantic import BaseModel
 
@@ -8,6 +9,20 @@ from app.constants import CONFIG_ROOT
 class Config(BaseModel):
     secret_key: str
 
+    send_queue_size: int = 32
+    send_queue_policy: Literal["drop", "replace-latest"] = "replace-latest"
+    slow_consumer_threshold: int = 64
+    broadcast_coalesce_window: float = 0.016
+    session_ttl: float = 300
+    heartbeat_interval: float = 15
+    heartbeat_timeout: float = 45
+    compression_threshold: int = 16384
+    template_cache_size: int = 512
+    config_watch: bool = True
+    config_watch_debounce: float = 0.3
+    config_watch_poll_interval: float = 1.0
+    config_registry_check_interval: float = 1.0
+
     @classmethod
     def load_config(cls):
 
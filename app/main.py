@@ -1,16 +1,26 @@
+from asyncio import create_task
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi_utilities import repeat_every
 
-from .routes import old_router, update_schedule_ticker, v1_router
+from .config import config
+from .models import rig_configs, timer_configs
+from .routes import config_watcher, old_router, reap_idle_connections, ticker_scheduler, v1_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await repeat_every(seconds=60)(update_schedule_ticker)()
+    rig_configs.scan()
+    timer_configs.scan()
+    tasks = [create_task(ticker_scheduler.run())]
+    if config.config_watch:
+        tasks.append(create_task(config_watcher.run()))
+    await repeat_every(seconds=config.heartbeat_interval)(reap_idle_connections)()
     yield
+    for task in tasks:
+        task.cancel()
 
 
 app = FastAPI(lifespan=lifespan)
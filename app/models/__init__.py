@@ -1,4 +1,4 @@
-from .base import ContextualModel
+from .base import ContextualModel, memoization_scope, memoized_in_scope
 from .event import (
     Event,
     EventAnnouncement,
@@ -13,6 +13,15 @@ from .event import (
     EventTalk,
     Template,
 )
-from .rig import RigConfig
-from .state import State, StateDecrementOverflow, StateException, StateIncrementOverflow, StateNotManual, TimerState
-from .timer import TimerConfig
+from .rig import rig_configs, RigConfig
+from .state import (
+    ALL_SECTIONS,
+    State,
+    StateDecrementOverflow,
+    StateException,
+    StateIncrementOverflow,
+    StateNotManual,
+    StateSection,
+    TimerState,
+)
+from .timer import timer_configs, TimerConfig
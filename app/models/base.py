@@ -1,6 +1,7 @@
 from contextlib import contextmanager
 from contextvars import ContextVar
-from typing import Any, Self
+from functools import wraps
+from typing import Any, Callable, Self
 
 from pydantic import BaseModel
 
@@ -28,3 +29,38 @@ class ContextualModel(BaseModel):
     def __init__(self, /, **data):
         with self._bind():
             super().__init__(**data)
+
+
+_memoized_values: ContextVar[dict | None] = ContextVar("_memoized_values", default=None)
+
+
+@contextmanager
+def memoization_scope():
+    """
+    Scope in which properties decorated with `memoized_in_scope` are computed at most once per instance.
+
+    Nested scopes share the outermost one. Values are dropped when it exits, so nothing may change the memoized
+    instances while the scope is active.
+    """
+    if _memoized_values.get() is not None:
+        yield
+        return
+    token = _memoized_values.set({})
+    try:
+        yield
+    finally:
+        _memoized_values.reset(token)
+
+
+def memoized_in_scope[T](func: Callable[[Any], T]) -> Callable[[Any], T]:
+    @wraps(func)
+    def wrapper(self) -> T:
+        values = _memoized_values.get()
+        if values is None:
+            return func(self)
+        key = (id(self), func.__name__)
+        if key not in values:
+            values[key] = func(self)
+        return values[key]
+
+    return wrapper
@@ -2,12 +2,12 @@ import tomllib
 from datetime import datetime, timedelta
 from enum import StrEnum
 from functools import cached_property
+from hashlib import sha256
 from itertools import chain
 from pathlib import Path, PurePath
-from typing import Annotated, Any, Literal, TYPE_CHECKING, TypeAlias
+from typing import Annotated, Any, Literal, NamedTuple, TYPE_CHECKING, TypeAlias
 from urllib.parse import urljoin
 
-import jinja2
 from fastapi.utils import deep_dict_update
 from pydantic import (
     AnyHttpUrl,
@@ -25,6 +25,7 @@ from app.constants import EVENT_CONFIGS_ROOT
 
 from .base import ContextualModel
 from ..utils.file_sha import get_file_sha
+from ..utils.templates import get_condition, get_template
 
 if TYPE_CHECKING:
     from .state import State
@@ -38,16 +39,14 @@ def timedelta_to_str(td: timedelta | None) -> str | None:
 
 class ReferencingEvent:
     _event: "Event | None" = None
-    _jinja_env: jinja2.Environment | None = None
 
     def model_post_init(self, __context: Any) -> None:
         self._event = Event.get_current_instance()
-        self._jinja_env = jinja2.Environment()
 
     def render_template(self, template: str, **extra_context) -> str:
         if self._event is None or self._event.get_state() is None:
             return ""
-        return self._jinja_env.from_string(template).render(
+        return get_template(template).render(
             **{**self.template_context(), **extra_context},
         )
 
@@ -161,6 +160,9 @@ class BaseViewScreen(ReferencingEvent, BaseModel):
     def refresh(self) -> None:
         pass
 
+    def get_referenced_states(self) -> list["State"]:
+        return []
+
     @computed_field()
     @property
     def info(self) -> str | None:
@@ -297,6 +299,9 @@ class OtherScheduleViewScreen(ScheduleViewScreen):
     def refresh(self) -> None:
         self.other_event_state.replace_event(Event.get_event_config(path=str(self.other_event_state.event.path)))
 
+    def get_referenced_states(self) -> list["State"]:
+        return [self.other_event_state]
+
     @cached_property
     def other_event_state(self):
         from .state import State
@@ -326,6 +331,9 @@ class OtherSchedulesViewScreen(ScheduleViewScreen):
         for state in self.other_event_states:
             state.replace_event(Event.get_event_config(path=str(state.event.path)))
 
+    def get_referenced_states(self) -> list["State"]:
+        return self.other_event_states
+
     @cached_property
     def other_event_states(self):
         from .state import State
@@ -400,16 +408,14 @@ class View(BaseModel):
         for screen in self.screens:
             screen.refresh()
 
+    def get_referenced_states(self) -> list["State"]:
+        return [state for screen in self.screens for state in screen.get_referenced_states()]
+
     def model_post_init(self, __context: Any) -> None:
         self._event = Event.get_current_instance()
 
     def get_active_screens(self, state: "State") -> list[ViewScreen]:
-        jinja_env = jinja2.Environment()
-        return [
-            screen
-            for screen in self.screens
-            if jinja_env.from_string(screen.condition).render(state=state, screen=screen) == "True"
-        ]
+        return [screen for screen in self.screens if get_condition(screen.condition)(state=state, screen=screen)]
 
     @computed_field
     @property
@@ -482,10 +488,135 @@ class TimerType(StrEnum):
     CLOCK = "clock"
 
 
+class EventDerivedData(BaseModel):
+    """
+    Data derived from the event config alone, computed once when the event is loaded.
+
+    It's replaced only together with the whole event, so nothing here may be modified, including the dumped schedule
+    items shared by all payloads.
+    """
+    model_config = ConfigDict(frozen=True)
+
+    schedule_dumps: list[dict[str, Any]]
+    schedule_starts: tuple[list[datetime], list[int]]
+    schedule_extra_columns: list[str]
+    schedule_show_duration: bool
+    schedule_show_timer_duration: bool
+    all_sponsors: list[EventSponsor]
+    presentation_sponsors: list[EventSponsor]
+    intermission_screens_count: int
+    branding_sha: str | None
+
+    @staticmethod
+    def get_schedule_starts(schedule: list["EventScheduleItem"]) -> tuple[list[datetime], list[int]]:
+        """
+        Sorted start times of schedule items, each paired with the highest index of an item starting at that time or
+        earlier, so the item in progress at any time can be found with a binary search.
+        """
+        scheduled = [(item.start, index) for index, item in enumerate(schedule) if item.start is not None]
+        starts = []
+        last_indices = []
+        for start, index in sorted(scheduled):
+            starts.append(start)
+            last_indices.append(max(index, last_indices[-1]) if last_indices else index)
+        return starts, last_indices
+
+    @classmethod
+    def from_event(cls, event: "Event") -> "EventDerivedData":
+        extra_columns = set()
+        for item in event.schedule:
+            if item.model_extra:
+                extra_columns |= set(item.model_extra.keys())
+        sponsors = [sponsor for group in event.sponsor_groups for sponsor in group.sponsors]
+
+        return cls(
+            schedule_dumps=[item.model_dump() for item in event.schedule],
+            schedule_starts=cls.get_schedule_starts(event.schedule),
+            schedule_extra_columns=list(extra_columns),
+            schedule_show_duration=any(item.duration is not None for item in event.schedule),
+            schedule_show_timer_duration=any(item.timer_duration is not None for item in event.schedule),
+            all_sponsors=sponsors,
+            presentation_sponsors=[
+                sponsor
+                for group in event.sponsor_groups if group.show_on_presentation
+                for sponsor in group.sponsors if sponsor.show_on_presentation
+            ],
+            intermission_screens_count=max(
+                (group.intermission_screen_number for group in event.sponsor_groups),
+                default=0,
+            ) + 1,
+            branding_sha=get_file_sha(f"static/branding/{event.branding}.css"),
+        )
+
+
+class EventConfigNode(NamedTuple):
+    stat_key: tuple[int, int]
+    sha: str
+    table: dict
+
+
+event_config_paths: dict[PurePath, Path] = {}
+event_config_nodes: dict[Path, EventConfigNode] = {}
+event_config_dicts: dict[PurePath, tuple[tuple[str | None, ...], dict]] = {}
+
+
+def copy_config_tree(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: copy_config_tree(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_config_tree(item) for item in value]
+    return value
+
+
+def get_event_config_path(path_node: PurePath) -> Path:
+    # paths come from requests, `get_event_config_node` only keeps the ones of existing files
+    if (config_path := event_config_paths.get(path_node)) is None:
+        config_path = (EVENT_CONFIGS_ROOT / path_node).resolve().with_suffix(".toml")
+    return config_path
+
+
+def get_event_config_node(path_node: PurePath) -> EventConfigNode | None:
+    """
+    Parsed `event` table of the config file of `path_node`, None when there is no such file.
+
+    The file is read again only when its modification time or size changed, and parsed again only when its content
+    did. The table is shared by all the events using the file and must not be mutated.
+    """
+    config_path = get_event_config_path(path_node)
+
+    try:
+        stat = config_path.stat()
+    except IOError:
+        event_config_nodes.pop(config_path, None)
+        return None
+
+    event_config_paths[path_node] = config_path
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    node = event_config_nodes.get(config_path)
+    if node is not None and node.stat_key == stat_key:
+        return node
+
+    try:
+        content = config_path.read_bytes()
+    except IOError:
+        event_config_nodes.pop(config_path, None)
+        return None
+
+    sha = sha256(content).hexdigest()
+    if node is not None and node.sha == sha:
+        node = node._replace(stat_key=stat_key)
+    else:
+        node = EventConfigNode(stat_key, sha, tomllib.loads(content.decode()).get("event") or {})
+    event_config_nodes[config_path] = node
+    return node
+
+
 class Event(ContextualModel):
     model_config = ConfigDict(extra="allow")
 
     _state: "State | None" = None
+    _derived: EventDerivedData | None = None
+    _config: dict | None = None
 
     path: PurePath  # this is injected by config loader
     name: str
@@ -522,6 +653,34 @@ class Event(ContextualModel):
         for view in self.views.values():
             view.refresh()
 
+    def get_changes(self, other: "Event") -> set[str]:
+        """
+        Top level config keys differing between this event and `other`, views being compared one by one and reported
+        as `views.<name>`.
+
+        Events are compared by the config they were loaded from, so nothing depending on the state is computed. Files
+        the config points to are compared by their digests, a changed branding stylesheet is reported as `branding`.
+        Events not loaded by `get_event_config` are considered different in every field.
+        """
+        if self._config is None or other._config is None:
+            return set(type(self).model_fields)
+
+        changes = {
+            key
+            for key in self._config.keys() | other._config.keys()
+            if key != "views" and self._config.get(key) != other._config.get(key)
+        }
+        if self.derived.branding_sha != other.derived.branding_sha:
+            changes.add("branding")
+        views, other_views = self._config.get("views", {}), other._config.get("views", {})
+        changes |= {
+            f"views.{name}" for name in views.keys() | other_views.keys() if views.get(name) != other_views.get(name)
+        }
+        return changes
+
+    def get_referenced_states(self) -> list["State"]:
+        return [state for view in self.views.values() for state in view.get_referenced_states()]
+
     @field_validator("schedule", mode="before")
     @classmethod
     def add_schedule_entries_lp(cls, value: list[dict]):
@@ -568,53 +727,65 @@ class Event(ContextualModel):
     def slug(self) -> str:
         return self.path.stem
 
+    @property
+    def derived(self) -> EventDerivedData:
+        """
+        Data derived from the config, computed when the event is loaded (or on first use for events built otherwise).
+        """
+        if self._derived is None:
+            self._derived = EventDerivedData.from_event(self)
+        return self._derived
+
     @computed_field
     @property
     def all_sponsors(self) -> list[EventSponsor]:
-        return [sponsor for group in self.sponsor_groups for sponsor in group.sponsors]
+        return self.derived.all_sponsors
 
     @computed_field
     @property
     def presentation_sponsors(self) -> list[EventSponsor]:
-        return [
-            sponsor
-            for group in self.sponsor_groups if group.show_on_presentation
-            for sponsor in group.sponsors if sponsor.show_on_presentation
-        ]
+        return self.derived.presentation_sponsors
 
     @computed_field
     @property
     def intermission_screens_count(self) -> int:
-        return max((group.intermission_screen_number for group in self.sponsor_groups), default=0) + 1
+        return self.derived.intermission_screens_count
 
     @computed_field
     @property
     def branding_sha(self) -> str | None:
-        return get_file_sha(f"static/branding/{self.branding}.css")
+        return self.derived.branding_sha
 
     @staticmethod
-    def get_event_dict(path: PurePath) -> "dict":
-
-        def get_table_from_toml(path_node: PurePath):
-            config_path = (EVENT_CONFIGS_ROOT / path_node).resolve().with_suffix(".toml")
-            with config_path.open("rb") as event_fd:
-                toml_data = tomllib.load(event_fd)
-
-            return toml_data.get("event") or {}
+    def get_config_files(path: PurePath) -> set[Path]:
+        """
+        Config files, existing or not, the event at `path` is loaded from.
+        """
+        return {get_event_config_path(node) for node in (*path.parents, path)}
 
-        config_dict = {}
-        for node in reversed(path.parents):
-            try:
-                deep_dict_update(config_dict, get_table_from_toml(node))
-            except IOError:
-                pass
+    @staticmethod
+    def get_event_dict(path: PurePath) -> "dict":
+        nodes = [get_event_config_node(node) for node in (*reversed(path.parents), path)]
+        if nodes[-1] is None:
+            raise FileNotFoundError(f"No event config for {path}")
 
-        deep_dict_update(config_dict, get_table_from_toml(path))
+        key = tuple(node.sha if node is not None else None for node in nodes)
+        cached = event_config_dicts.get(path)
+        if cached is None or cached[0] != key:
+            config_dict = {}
+            for node in nodes:
+                if node is not None:
+                    deep_dict_update(config_dict, copy_config_tree(node.table))
+            cached = event_config_dicts[path] = (key, config_dict)
 
-        return {**config_dict, "path": path}
+        return {**copy_config_tree(cached[1]), "path": path}
 
     @classmethod
     def get_event_config(cls, *, path: str) -> "Event":
         path = PurePath(path)
 
-        return cls.model_validate(cls.get_event_dict(path))
+        config_dict = cls.get_event_dict(path)
+        event = cls.model_validate(config_dict)
+        event._derived = EventDerivedData.from_event(event)
+        event._config = config_dict
+        return event
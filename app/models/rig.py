@@ -2,6 +2,7 @@ import tomllib
 from pathlib import Path
 
 from .base import ContextualModel
+from ..utils.config_registry import ConfigRegistry
 from app.constants import RIG_CONFIGS_ROOT
 
 
@@ -20,12 +21,17 @@ class RigConfig(ContextualModel):
             return None
 
     @classmethod
-    def get_rig_config(cls, slug: str) -> "RigConfig | None":
-        path = RIG_CONFIGS_ROOT / f"{slug}.toml"
-
+    def load_rig_config(cls, path: Path) -> "RigConfig | None":
         rig_dict = cls.get_rig_dict(path)
 
         if rig_dict is None:
             return None
 
         return cls.model_validate(rig_dict)
+
+    @classmethod
+    def get_rig_config(cls, slug: str) -> "RigConfig | None":
+        return rig_configs.get(slug)
+
+
+rig_configs: ConfigRegistry[RigConfig] = ConfigRegistry(RIG_CONFIGS_ROOT, RigConfig.load_rig_config)
@@ -1,8 +1,13 @@
+from bisect import bisect_right
 from datetime import datetime, timedelta, UTC
-from typing import Any, TYPE_CHECKING
+from enum import StrEnum
+from functools import partial
+from typing import Any, Callable, TYPE_CHECKING
 
-from pydantic import BaseModel, computed_field, ConfigDict, field_validator
+from pydantic import BaseModel, computed_field, GetCoreSchemaHandler, PrivateAttr
+from pydantic_core import core_schema
 
+from .base import memoized_in_scope
 from .event import Event, EventScheduleItem
 
 if TYPE_CHECKING:
@@ -28,37 +33,193 @@ class StateNotManual(StateException):
     detail = "Cannot modify state, not manually controlled."
 
 
-class TimerState(BaseModel):
-    target: int
-    started_at: int | None = None
-    offset: int = 0
+class StateSection(StrEnum):
+    """
+    Parts of the state changing independently, tracked to tell which derived data has to be rebuilt.
 
-    message: str = ""
+    `OTHER_EVENTS` covers states of other events referenced by views of this one. It's never marked dirty by this
+    state, depending on it compares revisions and tickers of referenced states instead.
+    """
+    TICKER = "ticker"
+    TIMER = "timer"
+    MESSAGE = "message"
+    EVENT = "event"
+    OTHER_EVENTS = "other-events"
 
 
-class State(BaseModel):
-    model_config = ConfigDict(validate_assignment=True)
+ALL_SECTIONS = tuple(StateSection)
+
+class TimerState:
+    """
+    Speaker timer, changed directly by control commands without any validation.
+
+    Every change is reported to `on_change`, so the owning state can track its revisions.
+    """
+    __slots__ = ("target", "started_at", "offset", "message", "on_change")
+
+    def __init__(self, target: int, started_at: int | None = None, offset: int = 0, message: str = ""):
+        self.on_change: Callable[[], None] | None = None
+        self.target = target
+        self.started_at = started_at
+        self.offset = offset
+        self.message = message
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if name != "on_change" and self.on_change is not None:
+            self.on_change()
 
+    def as_dict(self) -> dict:
+        return {
+            "target": self.target,
+            "started_at": self.started_at,
+            "offset": self.offset,
+            "message": self.message,
+        }
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: GetCoreSchemaHandler) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            lambda value: value if isinstance(value, cls) else cls(**value),
+            serialization=core_schema.plain_serializer_function_ser_schema(cls.as_dict),
+        )
+
+
+class StateCore:
+    """
+    Part of the state changing with commands: position of the manual ticker, stream message and the timer, along with
+    revisions of every section of the state.
+
+    It's kept out of pydantic, so changing it costs no more than setting an attribute.
+    """
+    __slots__ = ("manual_ticker", "message", "timer", "revision", "section_revisions")
+
+    def __init__(self, timer: TimerState):
+        self.manual_ticker = 0
+        self.message = ""
+        self.timer = timer
+        self.revision = 0
+        self.section_revisions: dict[StateSection, int] = {}
+        timer.on_change = partial(self.mark_dirty, StateSection.TIMER)
+
+    def mark_dirty(self, *sections: StateSection) -> int:
+        self.revision += 1
+        for section in sections:
+            self.section_revisions[section] = self.revision
+        return self.revision
+
+
+class State(BaseModel):
     event: Event
-    _manual_ticker: int = 0
+    _core: StateCore = PrivateAttr(
+        # 15 minutes default, will be read at some point from config.
+        default_factory=lambda: StateCore(TimerState(target=15 * 60 * 1000)),
+    )
+    _section_cache: dict[str, tuple[tuple, Any]] = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "message":
+            self._core.message = value
+            self._core.mark_dirty(StateSection.MESSAGE)
+            return
+        super().__setattr__(name, value)
+        if name == "event":
+            self._core.mark_dirty(StateSection.EVENT)
+
+    # Both are serialized right after the event, where they used to be as regular fields.
+    @computed_field
+    @property
+    def message(self) -> str:
+        return self._core.message
+
+    @computed_field
+    @property
+    def timer(self) -> TimerState:
+        return self._core.timer
 
-    message: str = ""
+    @property
+    def _manual_ticker(self) -> int:
+        return self._core.manual_ticker
+
+    def _move_manual_ticker(self, ticker: int) -> None:
+        self._core.manual_ticker = ticker
+        self._core.mark_dirty(StateSection.TICKER)
+
+    @property
+    def revision(self) -> int:
+        """
+        Number increased on every change of the state, including changes of the timer and replacing the event.
+        """
+        return self._core.revision
+
+    def mark_dirty(self, *sections: StateSection) -> int:
+        return self._core.mark_dirty(*sections)
+
+    def get_sections_key(self, sections: tuple[StateSection, ...]) -> tuple:
+        section_revisions = self._core.section_revisions
+        key = tuple(section_revisions.get(section, 0) for section in sections)
+        if StateSection.TICKER in sections:
+            key += (self._ticker,)
+        if StateSection.OTHER_EVENTS in sections:
+            key += tuple((other.revision, other._ticker) for other in self.event.get_referenced_states())
+        return key
+
+    def cached_section[T](self, name: str, sections: tuple[StateSection, ...], build: Callable[[], T]) -> T:
+        """
+        Value returned by `build`, reused until any of the `sections` it's derived from changes.
+
+        Ticker moving along the schedule over time is detected as well, by comparing the current ticker.
+        """
+        key = self.get_sections_key(sections)
+        cached = self._section_cache.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = build()
+        self._section_cache[name] = (key, value)
+        return value
 
-    timer: TimerState
+    @property
+    @memoized_in_scope
+    def _now(self) -> datetime:
+        return datetime.now(tz=UTC)
 
     @property
+    @memoized_in_scope
     def _schedule_ticker(self):
-        now = datetime.now(tz=UTC)
+        now = self._now
         leeway = timedelta(minutes=self.event.template.schedule_ticker_leeway)
-        current = 0
-        for i, entry in enumerate(self.event.schedule):
-            if entry.start is not None and entry.start <= now:
-                current = i
+        starts, last_indices = self.event.derived.schedule_starts
+        started = bisect_right(starts, now)
+        current = last_indices[started - 1] if started else 0
         entry = self.event.schedule[current]
         mid_talk = entry.start is not None and entry.start + leeway <= now
         return current * 2 + mid_talk
 
     @property
+    def is_schedule_driven(self) -> bool:
+        return self.event.template.ticker_source != "manual"
+
+    def get_next_ticker_change(self) -> datetime | None:
+        """
+        Nearest future time the schedule driven ticker can move at: start of a schedule item, or the start plus
+        `schedule_ticker_leeway`. `None` for manual tickers and when the whole schedule is behind.
+        """
+        if not self.is_schedule_driven:
+            return None
+        now = self._now
+        leeway = timedelta(minutes=self.event.template.schedule_ticker_leeway)
+        starts, _ = self.event.derived.schedule_starts
+        candidates = []
+        next_start = bisect_right(starts, now)
+        if next_start < len(starts):
+            candidates.append(starts[next_start])
+        next_leeway_end = bisect_right(starts, now - leeway)
+        if next_leeway_end < len(starts):
+            candidates.append(starts[next_leeway_end] + leeway)
+        return min(candidates, default=None)
+
+    @property
+    @memoized_in_scope
     def _ticker(self) -> int:
         return self._manual_ticker if self.event.template.ticker_source == "manual" else self._schedule_ticker
 
@@ -84,14 +245,14 @@ class State(BaseModel):
 
     def fix_ticker(self):
         if self._manual_ticker >= len(self.event.schedule) * 2:
-            self._manual_ticker = len(self.event.schedule) * 2 - 1
+            self._move_manual_ticker(len(self.event.schedule) * 2 - 1)
 
     def increment(self) -> tuple[int, bool]:
         if self.event.template.ticker_source != "manual":
             raise StateNotManual()
         if self._manual_ticker + 1 >= len(self.event.schedule) * 2:
             raise StateIncrementOverflow()
-        self._manual_ticker += 1
+        self._move_manual_ticker(self._manual_ticker + 1)
 
         return self.current_state
 
@@ -100,7 +261,7 @@ class State(BaseModel):
             raise StateNotManual()
         if self._manual_ticker - 1 < 0:
             raise StateDecrementOverflow()
-        self._manual_ticker -= 1
+        self._move_manual_ticker(self._manual_ticker - 1)
 
         return self.current_state
 
@@ -109,9 +270,10 @@ class State(BaseModel):
             new_state = new_state.split("-")
             new_state = int(new_state[0]), new_state[1] == "mid"
 
-        self._manual_ticker = new_state[0] * 2 + int(new_state[1])
+        self._move_manual_ticker(new_state[0] * 2 + int(new_state[1]))
 
     @property
+    @memoized_in_scope
     def _schedule_screen_ticker(self) -> int:
         return self._schedule_position(self._ticker) + self._is_mid_talk(self._ticker)
 
@@ -135,16 +297,19 @@ class State(BaseModel):
 
     @computed_field
     @property
+    @memoized_in_scope
     def current_schedule_item(self) -> EventScheduleItem:
         return self.event.schedule[self._schedule_position(self._ticker)]
 
     @property
+    @memoized_in_scope
     def remaining_schedule(self) -> list[EventScheduleItem]:
         return self.event.schedule[self._schedule_screen_ticker:]
 
     @property
+    @memoized_in_scope
     def global_context(self) -> dict:
-        schedule = [item.model_dump() for item in self.remaining_schedule]
+        schedule = self.event.derived.schedule_dumps[self._schedule_screen_ticker:]
 
         return {
             "message": self.message,
@@ -158,16 +323,22 @@ class State(BaseModel):
 
     @computed_field
     @property
+    @memoized_in_scope
     def title_screen_content(self) -> tuple[str, dict]:
-        return "next", {**self.global_context, "entry": self.current_schedule_item.model_dump()}
+        return "next", {
+            **self.global_context,
+            "entry": self.event.derived.schedule_dumps[self._schedule_position(self._ticker)],
+        }
 
     @computed_field
     @property
+    @memoized_in_scope
     def brb_screen_content(self) -> tuple[str, dict]:
         return "message", {**self.global_context, "info": "Back in a moment..."}
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_screen_content(self) -> tuple[str, dict]:
         if self._schedule_screen_ticker == 0:
             message = "Starting soon..."
@@ -179,24 +350,34 @@ class State(BaseModel):
 
     @computed_field
     @property
+    @memoized_in_scope
     def presentation_screen_content(self) -> tuple[str, dict]:
         return "presentation", {**self.global_context, "entry": self.current_schedule_item}
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule(self) -> list[dict]:
-        def get_state_for(item):
-            if self._is_mid_talk(self._ticker) and item == self.current_schedule_item:
+        current = self._schedule_position(self._ticker) if self._is_mid_talk(self._ticker) else None
+        # first item of the remaining schedule
+        upcoming = self._schedule_screen_ticker
+
+        def get_state_for(index):
+            if index == current:
                 return "current"
-            if self.remaining_schedule and item == self.remaining_schedule[0]:
+            if index == upcoming:
                 return "next"
-            if item in self.remaining_schedule:
+            if index > upcoming:
                 return "future"
             return "past"
-        return [{**item.model_dump(), "state": get_state_for(item)} for index, item in enumerate(self.event.schedule)]
+        return [
+            {**item, "state": get_state_for(index)}
+            for index, item in enumerate(self.event.derived.schedule_dumps)
+        ]
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_header(self) -> str:
         return self.event.get_schedule_header(
             state=self,
@@ -205,6 +386,7 @@ class State(BaseModel):
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_subheader(self) -> str:
         return self.event.get_schedule_subheader(
             state=self,
@@ -213,43 +395,43 @@ class State(BaseModel):
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_extra_columns(self) -> list[str]:
-        columns = set()
-        for item in self.event.schedule:
-            if item.model_extra:
-                columns |= set(item.model_extra.keys())
-        return list(columns)
+        return self.event.derived.schedule_extra_columns
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_show_duration(self) -> bool:
-        for item in self.event.schedule:
-            if item.duration is not None:
-                return True
-        return False
+        return self.event.derived.schedule_show_duration
 
     @computed_field
     @property
+    @memoized_in_scope
     def schedule_show_timer_duration(self) -> bool:
-        for item in self.event.schedule:
-            if item.timer_duration is not None:
-                return True
-        return False
+        return self.event.derived.schedule_show_timer_duration
 
     def get_view_for(self, view_name: str) -> dict | None:
         return self.event.views[view_name].model_dump() if view_name in self.event.views else None
 
-    def replace_event(self, event: Event) -> None:
+    def replace_event(self, event: Event) -> set[str]:
+        """
+        Switch to a reloaded event, returning what changed in its config (see `Event.get_changes`).
+
+        An event without any change is not switched to, so nothing built from the current one gets outdated.
+        """
+        changes = self.event.get_changes(event)
+        if not changes:
+            return changes
+
         self.event.remove_state()
         self.event = event
         self.event.inject_state(self)
+        return changes
 
     @classmethod
     def create_event_state(cls, *, path: str) -> "State":
-        state =  cls(
-            event=Event.get_event_config(path=path),
-            timer=TimerState(target=15 * 60 * 1000),  # 15 minutes default, will be read at some point from config.
-        )
+        state = cls(event=Event.get_event_config(path=path))
         state.event.inject_state(state)
         return state
 
@@ -4,6 +4,7 @@ from pathlib import Path
 from pydantic import BaseModel
 
 from app.constants import TIMER_CONFIGS_ROOT
+from ..utils.config_registry import ConfigRegistry
 
 
 
@@ -20,7 +21,12 @@ class TimerConfig(BaseModel):
             return {**tomllib.load(timer_fd)["timer"], "slug": path.stem}
 
     @classmethod
-    def get_timer_config(cls, slug: str) -> "TimerConfig":
-        path = TIMER_CONFIGS_ROOT / f"{slug}.toml"
-
+    def load_timer_config(cls, path: Path) -> "TimerConfig":
         return cls.model_validate(cls.get_timer_dict(path))
+
+    @classmethod
+    def get_timer_config(cls, slug: str) -> "TimerConfig | None":
+        return timer_configs.get(slug)
+
+
+timer_configs: ConfigRegistry[TimerConfig] = ConfigRegistry(TIMER_CONFIGS_ROOT, TimerConfig.load_timer_config)
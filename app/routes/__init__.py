@@ -1,11 +1,14 @@
 from fastapi import APIRouter
 
+from .blobs import event_blob_view
+from .config_watcher import config_watcher
 from .control import checklist_view, control_view, checklists_list_view
 from .demo import demo_view
 from .scenes import old_scene_view, scene_view, signage_view
+from .stats import stats_view
 from .timers import speaker_timer_view, timer_redirect
 from .utils import schedule_table_view
-from .websocket import update_schedule_ticker, ws_view
+from .websocket import reap_idle_connections, ticker_scheduler, ws_view
 
 old_router = APIRouter()
 
@@ -24,6 +27,7 @@ old_router.add_api_route("/{rig:str}/schedule-table.html", schedule_table_view)
 
 v1_router = APIRouter()
 
+v1_router.add_api_route("/event-blobs/{digest:str}", event_blob_view)
 v1_router.add_api_route("/events/{path:path}/demo", demo_view)
 v1_router.add_api_route("/events/{path:path}/views/signage-{view:str}", signage_view)
 v1_router.add_api_route("/events/{path:path}/views/signage-{view:str}/{state:str}", signage_view)
@@ -43,3 +47,5 @@ v1_router.add_api_websocket_route("/rigs/{rig_slug:str}/control/ws", ws_view)
 v1_router.add_api_websocket_route("/rigs/{rig_slug:str}/views/{role:str}/ws", ws_view)
 
 v1_router.add_api_route("/views/{name:str}/timer", timer_redirect)
+
+v1_router.add_api_route("/stats", stats_view)
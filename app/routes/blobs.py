@@ -0,0 +1,18 @@
+from fastapi import HTTPException, Response
+from starlette.status import HTTP_404_NOT_FOUND
+
+from ..state import event_blobs
+
+
+async def event_blob_view(digest: str):
+    if digest not in event_blobs:
+        raise HTTPException(HTTP_404_NOT_FOUND, "event blob not found")
+    return Response(
+        content=event_blobs[digest],
+        media_type="application/json",
+        headers={
+            # blobs are addressed by their content, the same hash will never point to anything else
+            "Cache-Control": "public, max-age=31536000, immutable",
+            "ETag": f'"{digest}"',
+        },
+    )
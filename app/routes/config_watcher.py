@@ -0,0 +1,109 @@
+from asyncio import sleep
+from collections.abc import AsyncIterator
+from pathlib import Path, PurePath
+
+from ..models import Event, rig_configs, timer_configs
+from ..models.state import states
+from ..state import managers
+from .websocket import (
+    CONFIG_LOAD_ERRORS,
+    get_actor,
+    is_event_data_change,
+    notify_referencing_events,
+    ticker_scheduler,
+)
+
+from app.config import config
+from app.constants import EVENT_CONFIGS_ROOT, RIG_CONFIGS_ROOT, TIMER_CONFIGS_ROOT
+
+try:
+    import watchfiles
+except ImportError:
+    watchfiles = None
+
+
+class ConfigWatcher:
+    """
+    Reloads events whose config files changed on disk, like `config.refresh` would, and drops changed rig and timer
+    configs from their registries.
+
+    Changes are watched with watchfiles when it's installed, by polling every `config_watch_poll_interval` seconds
+    otherwise. Bursts of writes are gathered until nothing changed for `config_watch_debounce` seconds. Only loaded
+    events whose own file or one of its ancestors changed are reloaded, notifying only roles of their managers that
+    are concerned by the change, and managers of events showing their schedules. Reloads of served events go through
+    their actors, configs that fail to load are reported and the event keeps its previous config.
+    """
+
+    roots = (EVENT_CONFIGS_ROOT, RIG_CONFIGS_ROOT, TIMER_CONFIGS_ROOT)
+
+    async def run(self) -> None:
+        async for changed in self.watch():
+            self.reload(changed)
+
+    def watch(self) -> AsyncIterator[set[Path]]:
+        if watchfiles is not None:
+            return self.watch_events()
+        return self.watch_polling()
+
+    async def watch_events(self) -> AsyncIterator[set[Path]]:
+        async for changes in watchfiles.awatch(
+            *(root for root in self.roots if root.is_dir()),
+            watch_filter=lambda change, path: path.endswith(".toml"),
+            step=round(config.config_watch_debounce * 1000),
+        ):
+            yield {Path(path).resolve() for _, path in changes}
+
+    def snapshot(self) -> dict[Path, tuple[int, int]]:
+        files = {}
+        for root in self.roots:
+            for path in root.rglob("*.toml"):
+                try:
+                    stat = path.stat()
+                except IOError:
+                    continue
+                files[path.resolve()] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    async def watch_polling(self) -> AsyncIterator[set[Path]]:
+        files = self.snapshot()
+        while True:
+            await sleep(config.config_watch_poll_interval)
+            changed = set()
+            while True:
+                current = self.snapshot()
+                burst = {path for path in files.keys() | current.keys() if files.get(path) != current.get(path)}
+                files = current
+                if not burst:
+                    break
+                changed |= burst
+                await sleep(config.config_watch_debounce)
+            if changed:
+                yield changed
+
+    def reload(self, changed: set[Path]) -> None:
+        rig_configs.invalidate(changed)
+        timer_configs.invalidate(changed)
+
+        reloaded = False
+        for event_path, state in list(states.items()):
+            if not Event.get_config_files(PurePath(event_path)) & changed:
+                continue
+
+            reloaded = True
+            if event_path in managers:
+                get_actor(managers[event_path], state).submit(None, {"action": "config.reload"}, 0)
+                continue
+            try:
+                changes = state.replace_event(Event.get_event_config(path=event_path))
+            except CONFIG_LOAD_ERRORS as ex:
+                print(f"config of {event_path} not reloaded: {ex}")
+                continue
+            state.fix_ticker()
+            if any(is_event_data_change(change) for change in changes):
+                notify_referencing_events(event_path, "config.reload")
+
+        if reloaded:
+            ticker_scheduler.replan()
+
+
+config_watcher = ConfigWatcher()
@@ -5,7 +5,7 @@ from fastapi import Request
 from pydantic_core import to_json
 
 from ..models import Event, State, TimerState
-from ..state import get_state_update_for
+from ..state import get_event_blob, get_state_update_for
 from ..template_renderer import renderer
 
 
@@ -47,7 +47,13 @@ async def scene_view(
         state_obj.move_to(state)
         scene_data = json.loads(
             to_json(
-                {"status": "init", "role": f"scene-{view}", **get_state_update_for(state_obj, f"scene-{view}", "init")},
+                {
+                    "status": "init",
+                    "role": f"scene-{view}",
+                    **get_state_update_for(state_obj, f"scene-{view}", "init"),
+                    # the page is rendered once, there is no point fetching the event separately
+                    "event": json.loads(get_event_blob(state_obj)[1]),
+                },
             ),
         )
     else:
@@ -79,7 +85,12 @@ async def signage_view(
         state_obj.move_to(state or "0-pre")
         view_data = json.loads(
             to_json(
-                {"status": "init", "role": f"signage-{view}", **get_state_update_for(state_obj, f"signage-{view}", "init")},
+                {
+                    "status": "init",
+                    "role": f"signage-{view}",
+                    **get_state_update_for(state_obj, f"signage-{view}", "init"),
+                    "event": json.loads(get_event_blob(state_obj)[1]),
+                },
             ),
         )
     else:
@@ -0,0 +1,8 @@
+from ..state import managers
+
+
+async def stats_view():
+    return {
+        event_path: manager.stats()
+        for event_path, manager in managers.items()
+    }
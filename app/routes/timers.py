@@ -1,5 +1,6 @@
-from fastapi import Request
+from fastapi import HTTPException, Request
 from fastapi.responses import RedirectResponse
+from starlette.status import HTTP_404_NOT_FOUND
 
 from ..models import TimerConfig
 from ..template_renderer import renderer
@@ -7,6 +8,8 @@ from ..template_renderer import renderer
 
 async def timer_redirect(timer_slug: str):
     timer_config = TimerConfig.get_timer_config(timer_slug)
+    if timer_config is None:
+        raise HTTPException(HTTP_404_NOT_FOUND, "timer not found")
     return RedirectResponse(
         f"/{timer_config.rig}/speaker-timer.html?preview={int(timer_config.with_preview)}&name={timer_slug}",
     )
@@ -1,14 +1,18 @@
+import tomllib
+from asyncio import create_task, Event as AsyncEvent, Task, timeout
 from base64 import urlsafe_b64encode
-from time import time_ns
-from typing import Annotated
+from collections import deque
+from datetime import datetime, UTC
+from time import monotonic, time_ns
+from typing import Annotated, Any, Literal
 from hashlib import sha256
 
 from fastapi import Depends
 from fastapi.websockets import WebSocket, WebSocketDisconnect
-from pydantic_core import to_json
+from pydantic import ValidationError
 
-from ..models import Event, RigConfig, State, StateException
-from ..state import ConnectionManager, get_state_update_for, get_ws_state, managers, rig_views
+from ..models import Event, RigConfig, State, StateException, StateSection
+from ..state import Connection, ConnectionManager, get_ws_state, managers, rig_views
 
 from app.config import config
 
@@ -33,26 +37,318 @@ async def notify_roles(
         "schedule",
     ):
         if target_role in notify:
-            await manager.broadcast_targeted_json(
-                get_state_update_for(state, target_role, command, rig_assigned_views),
+            await manager.broadcast_state_update(
+                state,
+                target_role,
+                command,
                 notify & {target_role, "debug"},
+                rig_assigned_views,
             )
 
 
+CONFIG_LOAD_ERRORS = (IOError, tomllib.TOMLDecodeError, ValidationError)
+
+# sections of a state shown by views of other events referencing it
+REFERENCED_SECTIONS = (StateSection.TICKER, StateSection.MESSAGE, StateSection.EVENT)
+
+CONFIG_ROLES = frozenset(
+    {
+        "scene",
+        "scene-brb",
+        "scene-presentation",
+        "scene-schedule",
+        "scene-title",
+        "signage",
+        "signage-schedule",
+        "schedule",
+        "control",
+    }
+)
+
+
+def is_event_data_change(change: str) -> bool:
+    """
+    Whether the config change (see `Event.get_changes`) touches anything besides views and the control password.
+    """
+    return not change.startswith("views.") and change != "control_password"
+
+
+def get_config_change_roles(changes: set[str]) -> set[str]:
+    """
+    Roles that need a new frame after the event config changed.
+
+    Every role gets the digest of the event blob, which leaves views and the control password out, so changes limited
+    to views only concern roles showing those views. Control and debug clients get the whole event.
+    """
+    if not changes:
+        return set()
+
+    roles = {"control", "debug"}
+    for change in changes:
+        if change.startswith("views."):
+            roles.add(change.removeprefix("views."))
+        elif is_event_data_change(change):
+            roles |= CONFIG_ROLES
+    return roles
+
+
+def notify_referencing_events(event_path: str, command: str) -> None:
+    """
+    Broadcast to served events showing schedules of the event at `event_path`.
+    """
+    for other_path, manager in managers.items():
+        if other_path == event_path:
+            continue
+        state = State.get_event_state(path=other_path)
+        if event_path in {str(other.event.path) for other in state.event.get_referenced_states()}:
+            get_actor(manager, state).schedule(CONFIG_ROLES | {"debug"}, command)
+
+
+class EventActor:
+    """
+    Applies commands of one event's control clients and of the config watcher, and broadcasts their results.
+
+    Commands are queued in the inbox and applied as soon as they arrive, in order, replying right away to their
+    sender, if any. Roles they notify are broadcast once `broadcast_coalesce_window` seconds after the first of them,
+    with the last command that notified each, so commands arriving meanwhile are applied and acknowledged right away
+    but share the same broadcasts. Events showing this one's schedule are notified when commands moved its ticker,
+    message or event. Building and queueing the payloads never yields, so every broadcast is a single consistent
+    snapshot including all commands applied before it.
+    """
+
+    def __init__(self, manager: ConnectionManager, state: State):
+        self.manager = manager
+        self.state = state
+        self.inbox: deque[tuple[Connection | None, Any, int, dict | None]] = deque()
+        self.pending: dict[str, tuple[Any, dict | None]] = {}
+        self.task: Task | None = None
+        self.arrived = AsyncEvent()
+
+    def submit(
+        self,
+        connection: Connection | None,
+        command: Any,
+        server_time: int,
+        rig_assigned_views: dict | None = None,
+    ) -> None:
+        self.inbox.append((connection, command, server_time, rig_assigned_views))
+        self.arrived.set()
+        self.wake_up()
+
+    def schedule(self, notify: set[str], command: Any, rig_assigned_views: dict | None = None) -> None:
+        for role in notify:
+            self.pending[role] = (command, rig_assigned_views)
+        self.wake_up()
+
+    def wake_up(self) -> None:
+        if self.task is None:
+            self.task = create_task(self.flush())
+
+    async def run_inbox(self) -> None:
+        """
+        Apply every queued command in order, replying to its sender and recording the roles it notifies.
+        """
+        self.arrived.clear()
+        referenced_key = self.state.get_sections_key(REFERENCED_SECTIONS)
+        while self.inbox:
+            connection, command, server_time, rig_assigned_views = self.inbox.popleft()
+            try:
+                reply, notify = await self.apply(command, server_time)
+            except StateException as ex:
+                reply, notify = {"status": "error", "detail": ex.detail}, set()
+            except Exception as ex:
+                print(f"command {command} failed: {ex!r}")
+                reply, notify = {"status": "error", "error": f"Command failed: {ex}"}, set()
+            if reply is not None and connection is not None:
+                connection.queue_json(reply)
+            for role in notify:
+                self.pending[role] = (command, rig_assigned_views)
+
+        if self.state.get_sections_key(REFERENCED_SECTIONS) != referenced_key:
+            notify_referencing_events(str(self.state.event.path), "other-events.update")
+
+    async def flush(self) -> None:
+        # a single flush runs at a time, commands arriving while it waits are applied by it right away
+        try:
+            while self.inbox or self.pending:
+                await self.run_inbox()
+                if not self.pending:
+                    continue
+
+                deadline = monotonic() + config.broadcast_coalesce_window
+                while (remaining := deadline - monotonic()) > 0:
+                    try:
+                        async with timeout(remaining):
+                            await self.arrived.wait()
+                    except TimeoutError:
+                        break
+                    await self.run_inbox()
+
+                pending, self.pending = self.pending, {}
+                debug = {"debug"} if "debug" in pending else set()
+                for role, (command, rig_assigned_views) in pending.items():
+                    try:
+                        await notify_roles({role} | debug, self.manager, self.state, command, rig_assigned_views)
+                    except Exception as ex:
+                        print(f"broadcast to {role} failed: {ex!r}")
+                ticker_scheduler.replan()
+        finally:
+            self.task = None
+
+    def config_not_loaded(self, ex: Exception) -> dict:
+        print(f"config of {self.state.event.path} not reloaded: {ex}")
+        return {"status": "error", "error": f"Config not reloaded: {ex}"}
+
+    async def apply(self, command: Any, server_time: int) -> tuple[dict | None, set[str]]:
+        """
+        Apply a single control command, returning the reply for its sender and roles to notify.
+        """
+        state = self.state
+        notify = {"control", "debug"}
+        match command:
+            case {"action": "event.tick"}:
+                state.increment()
+                notify.add("schedule")
+                notify.add("scene")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                notify.add("signage")
+                notify.add("signage-schedule")
+            case {"action": "event.untick"}:
+                state.decrement()
+                notify.add("schedule")
+                notify.add("scene")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                notify.add("signage")
+                notify.add("signage-schedule")
+            case {"action": "event.jump", "to": new_state}:
+                state.move_to(new_state)
+                notify.add("schedule")
+                notify.add("scene")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                notify.add("signage")
+                notify.add("signage-schedule")
+            case {"action": "stream.set-message", "message": message}:
+                notify.add("scene")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                state.message = message
+            case {"action": "timer.set", "time": set_time}:
+                notify.add("timer")
+                state.timer.target = set_time
+            case {"action": "timer.jog", "diff": jog_time}:
+                notify.add("timer")
+                state.timer.offset -= jog_time
+            case {"action": "timer.start"}:
+                if state.timer.started_at is not None:
+                    return {"status": "error", "error": f"Timer already started"}, set()
+                notify.add("timer")
+                state.timer.started_at = server_time
+            case {"action": "timer.stop"}:
+                if state.timer.started_at is None:
+                    return {"status": "error", "error": f"Timer already stopped"}, set()
+                notify.add("timer")
+                state.timer.offset += server_time - state.timer.started_at
+                state.timer.started_at = None
+            case {"action": "timer.reset"}:
+                notify.add("timer")
+                state.timer.offset = 0
+                if state.timer.started_at is not None:
+                    state.timer.started_at = server_time
+                if state.current_schedule_item.timer_duration is not None:
+                    state.timer.target = round(
+                        state.current_schedule_item.timer_duration.total_seconds()
+                    ) * 1000
+            case {"action": "timer.set-message", "message": message}:
+                notify.add("timer")
+                state.timer.message = message
+            case {"action": "timer.flash"}:
+                await self.manager.broadcast_targeted_json(
+                    {
+                        "status": "timer.flash",
+                    },
+                    {"timer", "control", "debug"},
+                )
+                return None, set()
+            case {"action": "config.refresh" | "config.reload"}:
+                try:
+                    event = Event.get_event_config(path=str(state.event.path))
+                except CONFIG_LOAD_ERRORS as ex:
+                    return self.config_not_loaded(ex), set()
+                changes = state.replace_event(event)
+                state.fix_ticker()
+                notify = get_config_change_roles(changes)
+            case {"action": "config.refresh-recursive"}:
+                notify.add("scene")
+                notify.add("scene-brb")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                notify.add("signage")
+                notify.add("signage-schedule")
+                notify.add("schedule")
+                notify.add("control")
+                try:
+                    state.event.deep_refresh()
+                    event = Event.get_event_config(path=str(state.event.path))
+                except CONFIG_LOAD_ERRORS as ex:
+                    return self.config_not_loaded(ex), set()
+                state.replace_event(event)
+                state.fix_ticker()
+            case {"action": "config.force-reload"}:
+                notify.add("scene")
+                notify.add("scene-brb")
+                notify.add("scene-presentation")
+                notify.add("scene-schedule")
+                notify.add("scene-title")
+                notify.add("signage")
+                notify.add("signage-schedule")
+                notify.add("schedule")
+                notify.add("control")
+            case {"action": other}:
+                print(f"action {other} unknown")
+                return {"status": "error", "error": f"Unknown action {other}"}, set()
+            case invalid:
+                print(f"invalid packet {invalid}")
+                return {"status": "error", "error": f"invalid packet", "packet": invalid}, set()
+        return {"status": "success"}, notify
+
+
+actors: dict[str, EventActor] = {}
+
+
+def get_actor(manager: ConnectionManager, state: State) -> EventActor:
+    path = str(state.event.path)
+    if path not in actors:
+        actors[path] = EventActor(manager, state)
+    return actors[path]
+
 
 async def ws_view(
     websocket: WebSocket,
     role: str,
     state_and_manager: Annotated[tuple[State, ConnectionManager, RigConfig] | None, Depends(get_ws_state)],
     view_name: str | None = None,
+    protocol: Literal["full", "delta"] = "full",
+    session: str | None = None,
+    revision: int | None = None,
+    full_state: bool = False,
 ):
     if state_and_manager is None:
         return
     state, manager, rig = state_and_manager
+    actor = get_actor(manager, state)
+    ticker_scheduler.track(rig.event_path)
 
     assigned_views = rig_views.setdefault(rig.slug, {})
 
-    await manager.connect(websocket, role)
+    connection = await manager.connect(websocket, role, protocol, session, full_state)
     if view_name is not None:
         stream_id = urlsafe_b64encode(
             sha256(f"{rig.slug}-{view_name}-{config.secret_key}".encode()).digest()
@@ -67,181 +363,153 @@ async def ws_view(
             stream_pwd,
         )
 
-        await notify_roles({"control", "debug"}, manager, state, "views.assigned", assigned_views)
+        actor.schedule({"control", "debug"}, "views.assigned", assigned_views)
     else:
         stream_id = None
         stream_pwd = None
-    await websocket.send_text(
-        to_json(
-            {
-                "status": "init",
-                "rig": rig.slug,
-                "role": role,
-                **get_state_update_for(
-                    state,
-                    role,
-                    "init",
-                    assigned_views,
-                ),
-                **({
-                    "stream": {
-                        "id": stream_id,
-                        "pwd": stream_pwd,
-                    },
-                } if view_name is not None and role == "timer" else {})
+    manager.send_document(
+        connection,
+        manager.get_state_payload(
+            state,
+            role,
+            "init",
+            {"status": "init", "rig": rig.slug, "role": role},
+            assigned_views,
+            full_state,
+        ),
+        {
+            "stream": {
+                "id": stream_id,
+                "pwd": stream_pwd,
             },
-        ).decode()
+        } if view_name is not None and role == "timer" else None,
+        resume_from=revision if connection.resumed else None,
     )
 
     try:
-        async for command in websocket.iter_json():
-            notify = {"control", "debug"}
+        async for command in connection.iter_commands():
+            connection.last_seen = monotonic()
             server_time = time_ns() // 1_000_000
-            try:
-                match command:
-                    case {"action": "ntc.sync", "client_time": client_time}:
-                        await websocket.send_json(
-                            {"status": "ntc.sync", "server_time": server_time, "offset": server_time - client_time},
-                        )
-                        continue  # we're not notifying others
-                    case _ if role == "control":
-                        match command:
-                            case {"action": "event.tick"}:
-                                state.increment()
-                                notify.add("schedule")
-                                notify.add("scene")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                            case {"action": "event.untick"}:
-                                state.decrement()
-                                notify.add("schedule")
-                                notify.add("scene")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                            case {"action": "event.jump", "to": new_state}:
-                                state.move_to(new_state)
-                                notify.add("schedule")
-                                notify.add("scene")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                            case {"action": "stream.set-message", "message": message}:
-                                notify.add("scene")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                state.message = message
-                            case {"action": "timer.set", "time": set_time}:
-                                notify.add("timer")
-                                state.timer.target = set_time
-                            case {"action": "timer.jog", "diff": jog_time}:
-                                notify.add("timer")
-                                state.timer.offset -= jog_time
-                            case {"action": "timer.start"}:
-                                if state.timer.started_at is not None:
-                                    await websocket.send_json({"status": "error", "error": f"Timer already started"})
-                                    continue
-                                notify.add("timer")
-                                state.timer.started_at = server_time
-                            case {"action": "timer.stop"}:
-                                if state.timer.started_at is None:
-                                    await websocket.send_json({"status": "error", "error": f"Timer already stopped"})
-                                    continue
-                                notify.add("timer")
-                                state.timer.offset += server_time - state.timer.started_at
-                                state.timer.started_at = None
-                            case {"action": "timer.reset"}:
-                                notify.add("timer")
-                                state.timer.offset = 0
-                                if state.timer.started_at is not None:
-                                    state.timer.started_at = server_time
-                                if state.current_schedule_item.timer_duration is not None:
-                                    state.timer.target = round(
-                                        state.current_schedule_item.timer_duration.total_seconds()
-                                    ) * 1000
-                            case {"action": "timer.set-message", "message": message}:
-                                notify.add("timer")
-                                state.timer.message = message
-                            case {"action": "timer.flash"}:
-                                await manager.broadcast_targeted_json(
-                                    {
-                                        "status": "timer.flash",
-                                    },
-                                    {"timer", "control", "debug"},
-                                )
-                                continue
-                            case {"action": "config.refresh"}:
-                                notify.add("scene")
-                                notify.add("scene-brb")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                                notify.add("schedule")
-                                notify.add("control")
-                                state.replace_event(Event.get_event_config(path=str(state.event.path)))
-                                state.fix_ticker()
-                            case {"action": "config.refresh-recursive"}:
-                                notify.add("scene")
-                                notify.add("scene-brb")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                                notify.add("schedule")
-                                notify.add("control")
-                                state.event.deep_refresh()
-                                state.replace_event(Event.get_event_config(path=str(state.event.path)))
-                                state.fix_ticker()
-                            case {"action": "config.force-reload"}:
-                                notify.add("scene")
-                                notify.add("scene-brb")
-                                notify.add("scene-presentation")
-                                notify.add("scene-schedule")
-                                notify.add("scene-title")
-                                notify.add("signage")
-                                notify.add("signage-schedule")
-                                notify.add("schedule")
-                                notify.add("control")
-                            case {"action": other}:
-                                print(f"action {other} unknown")
-                                await websocket.send_json({"status": "error", "error": f"Unknown action {other}"})
-                                continue
-                            case invalid:
-                                print(f"invalid packet {invalid}")
-                                await websocket.send_json(
-                                    {"status": "error", "error": f"invalid packet", "packet": invalid},
-                                )
-                                continue
-                        await websocket.send_json({"status": "success"})
-                        await notify_roles(notify, manager, state, command, assigned_views)
-                        await update_schedule_ticker()
-            except StateException as ex:
-                await websocket.send_json(
-                    {"status": "error", "detail": ex.detail},
-                )
+            match command:
+                case {"action": "pong"}:
+                    connection.answers_pings = True
+                    continue
+                case {"action": "ntc.sync", "client_time": client_time}:
+                    connection.queue_json(
+                        {"status": "ntc.sync", "server_time": server_time, "offset": server_time - client_time},
+                    )
+                    continue  # we're not notifying others
+                case {"action": "sync.resync"}:
+                    manager.send_document(
+                        connection,
+                        manager.get_state_payload(
+                            state,
+                            role,
+                            "sync.resync",
+                            {"status": "update", "target_roles": [role]},
+                            assigned_views,
+                            full_state,
+                        ),
+                    )
+                    continue
+                case _ if role == "control":
+                    actor.submit(connection, command, server_time, assigned_views)
     except WebSocketDisconnect:
         print("Connection closed by remote host")
         manager.disconnect(websocket)
         if view_name is not None:
             assigned_views.pop(view_name, None)
 
-        await notify_roles({"control", "debug"}, manager, state, "views.unassigned", assigned_views)
+        actor.schedule({"control", "debug"}, "views.unassigned", assigned_views)
 
 
-async def update_schedule_ticker():
+async def update_schedule_ticker(event_paths: set[str] | None = None):
     notify = {"schedule", "scene-schedule", "scene-presentation", "scene-title"}
 
     for event_path, manager in managers.items():
+        if event_paths is not None and event_path not in event_paths:
+            continue
         state = State.get_event_state(path=event_path)
         await notify_roles(notify, manager, state, "event.tick")
+
+
+class TickerScheduler:
+    """
+    Broadcasts schedule ticker updates of served events when their schedule driven tickers actually move.
+
+    Sleeps until the nearest schedule boundary of all served events (and events their views show schedules of), then
+    notifies only events whose tickers changed since. Anything that can move the boundaries, like config reloads or a
+    new event being served, has to call `replan`. A failing update is reported and retried after `retry_delay`
+    seconds.
+    """
+
+    retry_delay = 1.0
+
+    def __init__(self):
+        self.tickers: dict[str, tuple[int, ...]] = {}
+        self.wake_up = AsyncEvent()
+
+    def replan(self) -> None:
+        self.wake_up.set()
+
+    def track(self, event_path: str) -> None:
+        if event_path not in self.tickers:
+            self.replan()
+
+    @staticmethod
+    def get_schedule_driven_states(event_path: str) -> list[State]:
+        state = State.get_event_state(path=event_path)
+        return [state for state in (state, *state.event.get_referenced_states()) if state.is_schedule_driven]
+
+    async def tick(self) -> float | None:
+        """
+        Notify events whose tickers moved, returning the number of seconds until the next boundary.
+        """
+        moved = set()
+        boundaries = []
+        for event_path in list(managers):
+            states = self.get_schedule_driven_states(event_path)
+            tickers = tuple(state.current_state for state in states)
+            if self.tickers.get(event_path, tickers) != tickers:
+                moved.add(event_path)
+            self.tickers[event_path] = tickers
+            boundaries += [boundary for state in states if (boundary := state.get_next_ticker_change()) is not None]
+
+        if moved:
+            await update_schedule_ticker(moved)
+        if not boundaries:
+            return None
+        return max((min(boundaries) - datetime.now(tz=UTC)).total_seconds(), 0)
+
+    async def run(self) -> None:
+        while True:
+            self.wake_up.clear()
+            try:
+                delay = await self.tick()
+            except Exception as ex:
+                print(f"schedule ticker update failed: {ex!r}")
+                delay = self.retry_delay
+            try:
+                async with timeout(delay):
+                    await self.wake_up.wait()
+            except TimeoutError:
+                pass
+
+
+ticker_scheduler = TickerScheduler()
+
+
+async def reap_idle_connections():
+    deadline = monotonic() - config.heartbeat_timeout
+
+    for event_path, manager in managers.items():
+        idle = {connection.websocket for connection in manager.reap(deadline)}
+        if idle:
+            actor = get_actor(manager, State.get_event_state(path=event_path))
+            for assigned_views in rig_views.values():
+                unassigned = [name for name, (websocket, *_) in assigned_views.items() if websocket in idle]
+                for view_name in unassigned:
+                    del assigned_views[view_name]
+                if unassigned:
+                    actor.schedule({"control", "debug"}, "views.unassigned", assigned_views)
+        manager.ping()
@@ -1,58 +1,698 @@
+import json
 import secrets
-from asyncio import Event
+from asyncio import create_task, Event
+from base64 import urlsafe_b64encode
+from collections import deque, OrderedDict
+from hashlib import sha256
+from time import monotonic
+from enum import IntEnum
+from typing import Any, Callable, Hashable
 
-from fastapi.websockets import WebSocket
-from pydantic_core import to_json
+from fastapi.websockets import WebSocket, WebSocketDisconnect
+from pydantic_core import to_json, to_jsonable_python
 
-from app.models import RigConfig, State
+from app.config import config
+from app.models import ALL_SECTIONS, memoization_scope, RigConfig, State, StateSection
+from app.utils.json_patch import make_patch
+from app.utils.wire_formats import JSON, negotiate_wire_format, WireFormat
+
+
+class CachedPayload:
+    """
+    State update payload of a single role, serialized on first use.
+
+    The encoded frame and the JSON compatible document (used for delta updates and other wire formats) are derived
+    from each other, so the payload itself is built only once whichever is requested first.
+    """
+
+    def __init__(self, envelope: dict, build: Callable[[], dict]):
+        self.envelope = envelope
+        self.build = build
+        self._text: str | None = None
+        self._document: dict | None = None
+        self._frames: dict[str, str | bytes] = {}
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            data = self._document if self._document is not None else self.build()
+            self._text = to_json({**self.envelope, **data}).decode()
+        return self._text
+
+    @property
+    def document(self) -> dict:
+        if self._document is None:
+            if self._text is not None:
+                document = json.loads(self._text)
+                for key in self.envelope:
+                    del document[key]
+            else:
+                document = to_jsonable_python(self.build())
+            self._document = document
+        return self._document
+
+    def get_frame(self, wire_format: WireFormat) -> str | bytes:
+        if wire_format is JSON:
+            return self.text
+        if wire_format.name not in self._frames:
+            self._frames[wire_format.name] = wire_format.encode_json_text(self.text)
+        return self._frames[wire_format.name]
+
+
+class PayloadCache:
+    """
+    Update payloads, built once per state version and shared by every socket they are sent to.
+
+    Only payloads of the most recent version are kept, anything older is dropped as soon as a new version shows up.
+    """
+
+    def __init__(self):
+        self.version: tuple | None = None
+        self.payloads: dict[tuple, CachedPayload] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get_payload(self, version: tuple, key: tuple, envelope: dict, build: Callable[[], dict]) -> CachedPayload:
+        if version != self.version:
+            self.version = version
+            self.payloads.clear()
+
+        if key in self.payloads:
+            self.hits += 1
+            return self.payloads[key]
+
+        self.misses += 1
+        payload = self.payloads[key] = CachedPayload(envelope, build)
+        return payload
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "cached_payloads": len(self.payloads),
+        }
+
+
+class DeltaStream:
+    """
+    Documents recently sent to `delta` protocol connections of a single role, numbered with increasing revisions.
+
+    Every connection remembers the revision it received last, patches from that revision to the latest one are
+    computed once and shared by all connections sitting at the same revision. Full frames of the latest revision are
+    shared the same way.
+    """
+
+    history_size = 16
+
+    def __init__(self):
+        self.revision = 0
+        self.documents: dict[int, dict] = {}
+        self.patches: dict[int, list[dict]] = {}
+        self.patch_frames: dict[tuple[int, bytes, str], str | bytes] = {}
+        self.full_frames: dict[tuple[bytes, str], str | bytes] = {}
+
+    def push(self, document: dict) -> int:
+        if self.documents and self.documents[self.revision] == document:
+            return self.revision
+
+        self.revision += 1
+        self.documents[self.revision] = document
+        self.documents.pop(self.revision - self.history_size, None)
+        self.patches.clear()
+        self.patch_frames.clear()
+        self.full_frames.clear()
+        return self.revision
+
+    def get_patch_frame(self, base: int | None, envelope: dict, wire_format: WireFormat) -> str | bytes | None:
+        if base not in self.documents:
+            return None
+
+        if base not in self.patches:
+            self.patches[base] = make_patch(self.documents[base], self.documents[self.revision])
+
+        key = (base, to_json(envelope), wire_format.name)
+        if key not in self.patch_frames:
+            self.patch_frames[key] = wire_format.encode(
+                {
+                    "status": "patch",
+                    **envelope,
+                    "base": base,
+                    "revision": self.revision,
+                    "patch": self.patches[base],
+                },
+            )
+        return self.patch_frames[key]
+
+    def get_full_frame(self, envelope: dict, wire_format: WireFormat) -> str | bytes:
+        key = (to_json(envelope), wire_format.name)
+        if key not in self.full_frames:
+            self.full_frames[key] = wire_format.encode(
+                {**envelope, "revision": self.revision, **self.documents[self.revision]},
+            )
+        return self.full_frames[key]
+
+
+class Session:
+    """
+    Identity of a `delta` protocol client, letting it resume from the last revision it received after reconnecting.
+    """
+
+    def __init__(self, stream_key: tuple[str, bool]):
+        self.token = secrets.token_urlsafe(16)
+        self.stream_key = stream_key
+        self.expires_at: float | None = None
+
+
+class Priority(IntEnum):
+    HIGH = 0
+    BULK = 1
+
+
+# Documents of those roles are small and time sensitive, all other state documents are sent as bulk.
+ROLE_PRIORITIES: dict[str, Priority] = {
+    "timer": Priority.HIGH,
+}
+
+
+def get_role_priority(role: str) -> Priority:
+    return ROLE_PRIORITIES.get(role, Priority.BULK)
+
+
+class PayloadProjection:
+    """
+    Keys of the state update payload that clients of a role actually use.
+
+    `state_fields` are the fields of the state dump sent under the `state` key, which is left out when there are none.
+    Instead of the event, payloads carry `event_hash` referencing its static part, published by `get_event_blob`.
+    """
+
+    def __init__(self, fields: set[str], state_fields: set[str] | None = None):
+        self.fields = frozenset(fields)
+        self.state_fields = frozenset(state_fields or ())
+        if self.state_fields:
+            self.fields |= {"state"}
+
+
+# Payloads of roles not listed here (like `debug`) are sent whole.
+SCENE_PROJECTION = PayloadProjection(
+    {"for", "command", "event_hash", "current_state", "next_state", "previous_state", "template", "context", "view"},
+)
+ROLE_PROJECTIONS: dict[str, PayloadProjection] = {
+    "timer": PayloadProjection(
+        {"for", "command", "event_hash", "current_state", "timer"},
+        {"current_schedule_item"},
+    ),
+    "schedule": PayloadProjection(
+        {
+            "for", "command", "event_hash", "current_state",
+            "schedule", "extra_columns", "show_duration", "show_timer_duration",
+        },
+    ),
+    "control": PayloadProjection(
+        {
+            "for", "command", "event_hash", "current_state", "next_state", "previous_state", "timer", "message",
+            "assigned_views", "schedule", "extra_columns", "show_duration", "show_timer_duration",
+        },
+    ),
+}
+# Schedule and views of the event change with the state, so they are sent under their own keys instead. Blobs are
+# served to anyone knowing their hash, so they can't carry the control password either.
+EVENT_BLOB_EXCLUDE = {"schedule", "views", "control_password"}
+EVENT_BLOB_CACHE_SIZE = 64
+
+
+def get_role_projection(role: str) -> PayloadProjection | None:
+    if role.startswith("scene-") or role.startswith("signage-"):
+        return SCENE_PROJECTION
+    return ROLE_PROJECTIONS.get(role)
+
+
+class Connection:
+    """
+    Single websocket together with its outbound queues and the task writing those queues into the socket.
+
+    Sending only puts frames in the queue, so a stalled client never holds up anyone else. Every priority has its own
+    queue and the writer always sends high priority frames first, so short replies (sync, acknowledgements, timer
+    updates) don't wait behind large documents. Frames sent with a key are snapshots superseding each other: with the
+    `replace-latest` policy a newer frame takes the place of the one still waiting in the queue. When a queue is full,
+    its oldest frame is dropped. A client that had more frames replaced or dropped since its last successful send than
+    `slow_consumer_threshold` is disconnected.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        role: str,
+        manager: "ConnectionManager",
+        protocol: str = "full",
+        full_state: bool = False,
+    ):
+        self.websocket = websocket
+        self.role = role
+        self.manager = manager
+        self.protocol = protocol
+        self.full_state = full_state
+        self.wire_format, _ = negotiate_wire_format(websocket)
+        self.revision: int | None = None
+        self.session: Session | None = None
+        self.resumed = False
+        self.last_seen = monotonic()
+        self.answers_pings = False
+        self.queues: dict[Priority, deque[list]] = {priority: deque() for priority in Priority}
+        self.keyed_frames: dict[Hashable, list] = {}
+        self.lag = 0
+        self.closed = False
+        self.has_frames = Event()
+        self.writer = create_task(self.write_frames())
+
+    @property
+    def stream_key(self) -> tuple[str, bool]:
+        return self.role, self.full_state
+
+    def queue_frame(self, frame: str | bytes, key: Hashable | None = None, priority: Priority = Priority.HIGH) -> None:
+        if self.closed:
+            return
+
+        if key is not None and config.send_queue_policy == "replace-latest" and key in self.keyed_frames:
+            self.keyed_frames[key][1] = frame
+            self.lag += 1
+        else:
+            queue = self.queues[priority]
+            if len(queue) >= config.send_queue_size:
+                dropped_key, _ = queue.popleft()
+                self.keyed_frames.pop(dropped_key, None)
+                self.lag += 1
+            entry = [key, frame]
+            queue.append(entry)
+            if key is not None:
+                self.keyed_frames[key] = entry
+
+        if self.lag > config.slow_consumer_threshold:
+            self.manager.disconnect(self.websocket)
+            create_task(self.close(code=4408, reason="SlowConsumer"))
+            return
+
+        self.has_frames.set()
+
+    def queue_json(self, data: Any, key: Hashable | None = None, priority: Priority = Priority.HIGH) -> None:
+        self.queue_frame(self.wire_format.encode(data), key, priority)
+
+    def next_frame(self) -> str | bytes | None:
+        for queue in self.queues.values():
+            if queue:
+                key, frame = queue.popleft()
+                self.keyed_frames.pop(key, None)
+                return frame
+        return None
+
+    async def write_frames(self) -> None:
+        try:
+            while True:
+                await self.has_frames.wait()
+                while (frame := self.next_frame()) is not None:
+                    if isinstance(frame, bytes):
+                        await self.websocket.send_bytes(frame)
+                    else:
+                        await self.websocket.send_text(frame)
+                    self.lag = 0
+                    self.manager.count_traffic(self.role, frame)
+                self.has_frames.clear()
+        except (RuntimeError, OSError, WebSocketDisconnect):
+            self.manager.disconnect(self.websocket)
+
+    def stop(self) -> None:
+        self.closed = True
+        for queue in self.queues.values():
+            queue.clear()
+        self.keyed_frames.clear()
+        self.writer.cancel()
+
+    async def iter_commands(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+            yield self.wire_format.decode(message["text"] if message.get("text") is not None else message["bytes"])
+
+    async def close(self, code: int, reason: str) -> None:
+        try:
+            await self.websocket.close(code=code, reason=reason)
+        except RuntimeError:
+            pass
 
 
 class ConnectionManager:
+    # frames sent to any further role are counted together, as roles come from client chosen URLs
+    traffic_roles_limit = 64
+
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.connection_roles: dict[WebSocket, str] = {}
+        self.connections: dict[WebSocket, Connection] = {}
+        self.role_connections: dict[str, dict[WebSocket, Connection]] = {}
+        self.payload_cache = PayloadCache()
+        self.delta_streams: dict[tuple[str, bool], DeltaStream] = {}
+        self.sessions: dict[str, Session] = {}
+        self.traffic: dict[str, dict[str, int]] = {}
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        role: str,
+        protocol: str = "full",
+        session_token: str | None = None,
+        full_state: bool = False,
+    ) -> Connection:
+        connection = self.connections[websocket] = Connection(websocket, role, self, protocol, full_state)
+        self.role_connections.setdefault(role, {})[websocket] = connection
+        if protocol == "delta":
+            self.start_session(connection, session_token)
+        return connection
+
+    def expire_sessions(self) -> None:
+        """
+        Forget expired sessions, along with delta streams no connection nor live session follows anymore.
+        """
+        now = monotonic()
+        for token, session in list(self.sessions.items()):
+            if session.expires_at is not None and session.expires_at < now:
+                del self.sessions[token]
+
+        used_keys = {session.stream_key for session in self.sessions.values()}
+        used_keys |= {connection.stream_key for connection in self.connections.values()}
+        for stream_key in self.delta_streams.keys() - used_keys:
+            del self.delta_streams[stream_key]
 
-    async def connect(self, websocket: WebSocket, role: str):
-        self.active_connections.append(websocket)
-        self.connection_roles[websocket] = role
+    def start_session(self, connection: Connection, session_token: str | None) -> None:
+        self.expire_sessions()
+
+        session = self.sessions.get(session_token)
+        if session is not None and session.stream_key == connection.stream_key:
+            session.expires_at = None
+            connection.resumed = True
+        else:
+            session = Session(connection.stream_key)
+            self.sessions[session.token] = session
+        connection.session = session
+        connection.queue_json({"status": "session", "session": session.token})
 
     def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        role_connections = self.role_connections[connection.role]
+        del role_connections[websocket]
+        if not role_connections:
+            del self.role_connections[connection.role]
+        if connection.session is not None:
+            connection.session.expires_at = monotonic() + config.session_ttl
+        connection.stop()
+
+    def ping(self) -> None:
+        self.queue_shared_json(list(self.connections.values()), {"status": "ping"}, key="ping")
+
+    def reap(self, deadline: float) -> list[Connection]:
+        """
+        Disconnect and close every connection that didn't send anything since `deadline`.
+
+        Only clients that answered a ping before are expected to keep answering, others (like scripts and older
+        pages) are left to the websocket protocol level ping of the server.
+        """
+        idle = [
+            connection
+            for connection in self.connections.values()
+            if connection.answers_pings and connection.last_seen < deadline
+        ]
+        for connection in idle:
+            self.disconnect(connection.websocket)
+            create_task(connection.close(code=4408, reason="HeartbeatTimeout"))
+        self.expire_sessions()
+        return idle
+
+    def get_connections(self, roles: set[str]) -> list[Connection]:
+        return [
+            connection
+            for role in roles & self.role_connections.keys()
+            for connection in self.role_connections[role].values()
+        ]
+
+    def count_traffic(self, role: str, frame: str | bytes) -> None:
+        """
+        Count frames sent to given role, with their size before (`raw_bytes`) and after (`sent_bytes`) compression.
+
+        Sizes of text frames are counted in characters. The server runs without permessage-deflate, so `sent_bytes` is
+        what goes over the wire. Past `traffic_roles_limit` roles, frames are counted as `other`.
+        """
+        if role not in self.traffic and len(self.traffic) >= self.traffic_roles_limit:
+            role = "other"
+        traffic = self.traffic.setdefault(role, {"frames": 0, "raw_bytes": 0, "sent_bytes": 0})
+        traffic["frames"] += 1
+        traffic["raw_bytes"] += getattr(frame, "raw_size", len(frame))
+        traffic["sent_bytes"] += len(frame)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "roles": {role: len(connections) for role, connections in self.role_connections.items()},
+            "payload_cache": self.payload_cache.stats(),
+            "traffic": self.traffic,
+        }
 
     async def broadcast_targeted_json(self, data, target_roles):
         await self.broadcast(
-            to_json(
-                {
-                    "status": "update",
-                    "target_roles": list(target_roles),
-                    **data
-                }
-            ).decode(),
+            {
+                "status": "update",
+                "target_roles": list(target_roles),
+                **data
+            },
             target_roles,
         )
 
-    async def broadcast(self, text: str, roles_to_notify: set[str]):
-        for connection in list(self.active_connections):
-            role = self.connection_roles[connection]
-            if role not in roles_to_notify:
+    def get_state_payload(
+        self,
+        state: State,
+        role: str,
+        command: Any,
+        envelope: dict,
+        rig_assigned_views: dict | None = None,
+        full_state: bool = False,
+    ) -> CachedPayload:
+        if role in ("control", "debug") and rig_assigned_views is not None:
+            views_key = tuple((slug, view_role) for slug, (_, view_role, _, _) in rig_assigned_views.items())
+        else:
+            views_key = None
+        return self.payload_cache.get_payload(
+            get_state_version(state),
+            (str(state.event.path), role, to_json(command), to_json(envelope), views_key, full_state),
+            envelope,
+            lambda: get_state_update_for(state, role, command, rig_assigned_views, full_state),
+        )
+
+    async def broadcast_state_update(
+        self,
+        state: State,
+        role: str,
+        command: Any,
+        target_roles: set[str],
+        rig_assigned_views: dict | None = None,
+    ):
+        envelope = {"status": "update", "target_roles": list(target_roles)}
+        payloads: dict[bool, CachedPayload] = {}
+
+        def get_payload(full_state: bool) -> CachedPayload:
+            if full_state not in payloads:
+                payloads[full_state] = self.get_state_payload(
+                    state, role, command, envelope, rig_assigned_views, full_state,
+                )
+            return payloads[full_state]
+
+        priority = get_role_priority(role)
+        delta_connections = []
+        for connection in self.get_connections(target_roles):
+            if connection.protocol == "delta" and connection.role == role:
+                delta_connections.append(connection)
+            else:
+                frame = get_payload(connection.full_state).get_frame(connection.wire_format)
+                connection.queue_frame(frame, ("update", role), priority)
+
+        revisions: dict[bool, int] = {}
+        for connection in delta_connections:
+            stream = self.delta_streams.setdefault(connection.stream_key, DeltaStream())
+            if connection.full_state not in revisions:
+                revisions[connection.full_state] = stream.push(get_payload(connection.full_state).document)
+            revision = revisions[connection.full_state]
+            if connection.revision == revision:
                 continue
-            try:
-                await connection.send_text(text)
-            except RuntimeError:
-                self.active_connections.remove(connection)
+            frame = stream.get_patch_frame(
+                connection.revision,
+                {"target_roles": envelope["target_roles"]},
+                connection.wire_format,
+            )
+            if frame is None:
+                frame = stream.get_full_frame(envelope, connection.wire_format)
+            connection.queue_frame(frame, priority=priority)
+            connection.revision = revision
+
+    def send_document(
+        self,
+        connection: Connection,
+        payload: CachedPayload,
+        extra: dict | None = None,
+        resume_from: int | None = None,
+    ) -> None:
+        """
+        Send full document to a single connection, registering it as a new revision for `delta` connections.
+
+        Resumed `delta` connections get a patch from the revision they received last instead, as long as that revision
+        is still known.
+        """
+        priority = get_role_priority(connection.role)
+        if connection.protocol != "delta":
+            if extra:
+                connection.queue_json({**payload.envelope, **payload.document, **extra}, priority=priority)
+            else:
+                connection.queue_frame(payload.get_frame(connection.wire_format), priority=priority)
+            return
+
+        document = {**payload.document, **to_jsonable_python(extra)} if extra else payload.document
+        stream = self.delta_streams.setdefault(connection.stream_key, DeltaStream())
+        stream.push(document)
+        frame = None
+        if resume_from is not None:
+            # clients rebuild the init frame from the patched document, which may come from a resync without these
+            envelope = {"resume": True, "rig": payload.envelope.get("rig"), "role": payload.envelope.get("role")}
+            frame = stream.get_patch_frame(resume_from, envelope, connection.wire_format)
+        if frame is None:
+            frame = stream.get_full_frame(payload.envelope, connection.wire_format)
+        connection.queue_frame(frame, priority=priority)
+        connection.revision = stream.revision
+
+    async def broadcast(
+        self,
+        data: dict,
+        roles_to_notify: set[str],
+        key: Hashable | None = None,
+        priority: Priority = Priority.HIGH,
+    ):
+        self.queue_shared_json(self.get_connections(roles_to_notify), data, key, priority)
+
+    @staticmethod
+    def queue_shared_json(
+        connections: list[Connection],
+        data: dict,
+        key: Hashable | None = None,
+        priority: Priority = Priority.HIGH,
+    ) -> None:
+        """
+        Queue the same data to many connections, encoding it once per wire format.
+        """
+        frames: dict[str, str | bytes] = {}
+        for connection in connections:
+            wire_format = connection.wire_format
+            if wire_format.name not in frames:
+                frames[wire_format.name] = wire_format.encode(data)
+            connection.queue_frame(frames[wire_format.name], key, priority)
 
 
 managers: dict[str, ConnectionManager] = {}
+event_blobs: OrderedDict[str, str] = OrderedDict()
 assignable_views: dict[str, tuple[WebSocket, Event]] = {}
 rig_views: dict[str, dict[str, tuple[WebSocket, str, str, str]]] = {}
 
 
+def get_state_version(state: State) -> tuple:
+    """
+    Everything besides the role and command that an update frame of given state depends on.
+
+    Schedule driven tickers move with time and other event schedule screens render states of other events, so their
+    positions are a part of the version as well.
+    """
+    return (
+        state.revision,
+        state.current_state,
+        *((other.revision, other.current_state) for other in state.event.get_referenced_states()),
+    )
+
+
+def get_event_blob(state: State) -> tuple[str, str]:
+    """
+    Static part of the state's event serialized into JSON, together with the hash of its content.
+
+    The blob is published under that hash, so clients can fetch it from `/v1/event-blobs/{hash}` once and cache it for
+    good. Only `EVENT_BLOB_CACHE_SIZE` most recently used blobs are kept.
+    """
+
+    def build() -> tuple[str, str]:
+        text = to_json(state.event, exclude=EVENT_BLOB_EXCLUDE).decode()
+        return urlsafe_b64encode(sha256(text.encode()).digest())[:16].decode(), text
+
+    digest, text = state.cached_section("event:blob", (StateSection.EVENT,), build)
+    event_blobs[digest] = text
+    event_blobs.move_to_end(digest)
+    while len(event_blobs) > EVENT_BLOB_CACHE_SIZE:
+        event_blobs.popitem(last=False)
+    return digest, text
+
+
+def get_view_section(state: State, view: str) -> dict | None:
+    # views come from the URL, only cache the configured ones
+    if view not in state.event.views:
+        return None
+    return state.cached_section(f"view:{view}", ALL_SECTIONS, lambda: state.get_view_for(view))
+
+
+def get_screen_section(state: State, name: str) -> Any:
+    """
+    Screen content of the state (like `title_screen_content`) converted into JSON compatible data.
+    """
+    return state.cached_section(
+        name,
+        (StateSection.TICKER, StateSection.EVENT, StateSection.MESSAGE),
+        lambda: to_jsonable_python(getattr(state, name)),
+    )
+
+
+def get_schedule_sections(state: State) -> dict:
+    columns = state.cached_section(
+        "schedule_columns",
+        (StateSection.EVENT,),
+        lambda: {
+            "extra_columns": state.schedule_extra_columns,
+            "show_duration": state.schedule_show_duration,
+            "show_timer_duration": state.schedule_show_timer_duration,
+        },
+    )
+    return {
+        "schedule": state.cached_section("schedule", (StateSection.TICKER, StateSection.EVENT), lambda: state.schedule),
+        **columns,
+    }
+
+
+@memoization_scope()
 def get_state_update_for(
     state: State,
     target: str,
     command: str | None = None,
     rig_assigned_views: dict | None = None,
+    full_state: bool = False,
 ) -> dict:
+    """
+    State update payload for given role, limited to keys its clients use (see `ROLE_PROJECTIONS`) unless `full_state`
+    is requested.
+
+    Derived state properties are computed once per payload, including the nested ones.
+    """
+    projection = None if full_state else get_role_projection(target)
+    if projection is None:
+        state_dump = state.cached_section("state", ALL_SECTIONS, lambda: to_jsonable_python(state))
+        event_dump = state.cached_section("event", ALL_SECTIONS, lambda: to_jsonable_python(state.event))
+    else:
+        state_dump = {field: to_jsonable_python(getattr(state, field)) for field in projection.state_fields}
+        event_dump = None
     global_scene_context = {
         "current_state": state.current_state,
         "next_state": state.next_state,
@@ -64,73 +704,80 @@ def get_state_update_for(
             "offset": state.timer.offset,
             "message": state.timer.message,
         },
-        "state": state,
+        "state": state_dump,
         "command": command,
-        "event": state.event,
+        "event": event_dump,
     }
+    if projection is not None:
+        global_scene_context["event_hash"], _ = get_event_blob(state)
     if rig_assigned_views is not None:
         prepared_views = {slug: (role, stream, pwd) for slug, (_, role, stream, pwd) in rig_assigned_views.items()}
     else:
         prepared_views = None
     match target:
         case "scene-title":
-            next_template, next_context = state.title_screen_content
-            return {
+            next_template, next_context = get_screen_section(state, "title_screen_content")
+            payload = {
                 "template": next_template,
                 "context": next_context,
-                "view": state.get_view_for("scene-title"),
+                "view": get_view_section(state, "scene-title"),
                 **global_scene_context,
             }
         case "scene-brb":
-            brb_template, brb_context = state.brb_screen_content
-            return {
+            brb_template, brb_context = get_screen_section(state, "brb_screen_content")
+            payload = {
                 "template": brb_template,
                 "context": brb_context,
-                "view": state.get_view_for("scene-brb"),
+                "view": get_view_section(state, "scene-brb"),
                 **global_scene_context,
             }
         case "scene-presentation":
-            presentation_template, presentation_context = state.presentation_screen_content
-            return {
+            presentation_template, presentation_context = get_screen_section(state, "presentation_screen_content")
+            payload = {
                 "template": presentation_template,
                 "context": presentation_context,
-                "view": state.get_view_for("scene-presentation"),
+                "view": get_view_section(state, "scene-presentation"),
                 **global_scene_context,
             }
         case str(view) if view.startswith("scene-") or view.startswith("signage-"):
-            return {
-                "context": state.global_context,
-                "view": state.get_view_for(view),
+            payload = {
+                "context": get_screen_section(state, "global_context"),
+                "view": get_view_section(state, view),
                 **global_scene_context,
             }
         case "timer":
-            return {
+            payload = {
                 **global_scene_context,
             }
         case "schedule":
-            return {
-                "schedule": state.schedule,
-                "extra_columns": state.schedule_extra_columns,
-                "show_duration": state.schedule_show_duration,
-                "show_timer_duration": state.schedule_show_timer_duration,
+            payload = {
+                **get_schedule_sections(state),
                 **global_scene_context,
             }
         case ("control" | "debug"):
-            return {
-                "scene-brb": get_state_update_for(state, "scene-brb", "d"),
-                "scene-title": get_state_update_for(state, "scene-title", "d"),
-                "scene-schedule": get_state_update_for(state, "scene-schedule", "c"),
-                "scene-presentation": get_state_update_for(state, "scene-presentation", "b"),
-                "speaker-timer": get_state_update_for(state, "timer", "a"),
+            if projection is None:
+                scenes = {
+                    "scene-brb": get_state_update_for(state, "scene-brb", "d", full_state=True),
+                    "scene-title": get_state_update_for(state, "scene-title", "d", full_state=True),
+                    "scene-schedule": get_state_update_for(state, "scene-schedule", "c", full_state=True),
+                    "scene-presentation": get_state_update_for(state, "scene-presentation", "b", full_state=True),
+                    "speaker-timer": get_state_update_for(state, "timer", "a", full_state=True),
+                }
+            else:
+                scenes = {}
+            payload = {
+                **scenes,
                 "message": state.message,
                 "assigned_views": prepared_views,
-                "schedule": state.schedule,
-                "extra_columns": state.schedule_extra_columns,
-                "show_duration": state.schedule_show_duration,
-                "show_timer_duration": state.schedule_show_timer_duration,
+                **get_schedule_sections(state),
                 **global_scene_context,
             }
-    return global_scene_context
+        case _:
+            payload = global_scene_context
+
+    if projection is None:
+        return payload
+    return {key: value for key, value in payload.items() if key in projection.fields}
 
 
 async def get_ws_state(
@@ -146,7 +793,7 @@ async def get_ws_state(
     if role == "control" and not secrets.compare_digest(control_password, rig.control_password):
         await websocket.close(code=4401, reason="Unauthorized")
         return None
-    await websocket.accept()
+    await websocket.accept(subprotocol=negotiate_wire_format(websocket)[1])
 
     manager = managers.setdefault(rig.event_path, ConnectionManager())
     state = State.get_event_state(path=rig.event_path)
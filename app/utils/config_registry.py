@@ -0,0 +1,81 @@
+import tomllib
+from pathlib import Path
+from time import monotonic
+from typing import Callable, NamedTuple
+
+from pydantic import ValidationError
+
+from app.config import config
+
+
+class ConfigRegistryEntry[T](NamedTuple):
+    stat_key: tuple[int, int]
+    value: T | None
+    checked_at: float
+
+
+class ConfigRegistry[T]:
+    """
+    Configs of one directory, loaded by slug (file name without `.toml`) and kept in memory.
+
+    A file is checked again at most every `config_registry_check_interval` seconds, and loaded again only when its
+    modification time or size changed. Slugs without a file are answered from the directory listing, refreshed at most
+    as often, so unknown slugs don't reach the disk on every request. `invalidate` forgets given files right away.
+    Configs are shared by all callers and must not be mutated.
+    """
+
+    def __init__(self, root: Path, load: Callable[[Path], T | None]):
+        self.root = root
+        self.load = load
+        self.entries: dict[str, ConfigRegistryEntry[T]] = {}
+        self.slugs: set[str] = set()
+        self.listed_at: float | None = None
+
+    def list_slugs(self) -> None:
+        self.slugs = {path.stem for path in self.root.glob("*.toml")} if self.root.is_dir() else set()
+        self.listed_at = monotonic()
+
+    def scan(self) -> None:
+        """
+        Load every config of the directory, reporting the ones failing to load.
+        """
+        self.list_slugs()
+        for slug in sorted(self.slugs):
+            try:
+                self.get(slug)
+            except (KeyError, tomllib.TOMLDecodeError, ValidationError) as ex:
+                print(f"config {self.root / slug}.toml not loaded: {ex!r}")
+
+    def get(self, slug: str) -> T | None:
+        now = monotonic()
+        if slug not in self.slugs:
+            if self.listed_at is not None and now - self.listed_at < config.config_registry_check_interval:
+                return None
+            self.list_slugs()
+            if slug not in self.slugs:
+                return None
+
+        entry = self.entries.get(slug)
+        if entry is not None and now - entry.checked_at < config.config_registry_check_interval:
+            return entry.value
+
+        path = self.root / f"{slug}.toml"
+        try:
+            stat = path.stat()
+        except IOError:
+            self.slugs.discard(slug)
+            self.entries.pop(slug, None)
+            return None
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        value = entry.value if entry is not None and entry.stat_key == stat_key else self.load(path)
+        self.entries[slug] = ConfigRegistryEntry(stat_key, value, now)
+        return value
+
+    def invalidate(self, paths: set[Path]) -> None:
+        root = self.root.resolve()
+        changed = {path.stem for path in paths if path.parent == root and path.suffix == ".toml"}
+        if changed:
+            for slug in changed:
+                self.entries.pop(slug, None)
+            self.listed_at = None
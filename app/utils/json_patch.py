@@ -0,0 +1,51 @@
+from typing import Any
+
+
+def escape_pointer_token(token: str | int) -> str:
+    return str(token).replace("~", "~0").replace("/", "~1")
+
+
+def make_patch(old: Any, new: Any, path: str = "") -> list[dict]:
+    """
+    JSON Patch (RFC 6902) operations turning `old` into `new`, both being JSON compatible python objects.
+
+    Only `add`, `remove` and `replace` operations are produced. Lists are compared element by element after skipping
+    their common beginning and end, so items added or removed at either end of a list (like the remaining schedule
+    moving forward) don't touch the rest of it.
+    """
+    if old == new and type(old) is type(new):
+        return []
+
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = []
+        for key in old.keys() - new.keys():
+            operations.append({"op": "remove", "path": f"{path}/{escape_pointer_token(key)}"})
+        for key, value in new.items():
+            if key in old:
+                operations += make_patch(old[key], value, f"{path}/{escape_pointer_token(key)}")
+            else:
+                operations.append({"op": "add", "path": f"{path}/{escape_pointer_token(key)}", "value": value})
+        return operations
+
+    if isinstance(old, list) and isinstance(new, list):
+        shorter = min(len(old), len(new))
+        prefix = 0
+        while prefix < shorter and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < shorter - prefix and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+        old_middle = old[prefix:len(old) - suffix]
+        new_middle = new[prefix:len(new) - suffix]
+
+        common = min(len(old_middle), len(new_middle))
+        operations = []
+        for index in range(common):
+            operations += make_patch(old_middle[index], new_middle[index], f"{path}/{prefix + index}")
+        for index in range(common, len(new_middle)):
+            operations.append({"op": "add", "path": f"{path}/{prefix + index}", "value": new_middle[index]})
+        for index in reversed(range(common, len(old_middle))):
+            operations.append({"op": "remove", "path": f"{path}/{prefix + index}"})
+        return operations
+
+    return [{"op": "replace", "path": path, "value": new}]
@@ -0,0 +1,47 @@
+import re
+from functools import lru_cache
+from typing import Callable
+
+import jinja2
+
+from app.config import config
+
+jinja_env = jinja2.Environment()
+
+SINGLE_EXPRESSION = re.compile(r"\{\{(?P<expression>(?:(?!\{\{|\}\}|\{%|\{#).)*)\}\}", re.DOTALL)
+
+
+@lru_cache(maxsize=config.template_cache_size)
+def get_template(source: str) -> jinja2.Template:
+    """
+    Template compiled from `source` by the shared environment, kept for the next renders of the same source.
+    """
+    return jinja_env.from_string(source)
+
+
+@lru_cache(maxsize=config.template_cache_size)
+def get_condition(source: str) -> Callable[..., bool]:
+    """
+    Callable telling whether the template `source` renders as `True` with the given context.
+
+    Sources without any template syntax are compared once, sources made of a single `{{ expression }}` are compiled
+    as an expression and their result compared the way it would be rendered. Other sources are rendered.
+    """
+    # rendering drops a trailing newline, leave those sources to the template
+    if "{" not in source and not source.endswith(("\n", "\r")):
+        result = source == "True"
+        return lambda **context: result
+
+    match = SINGLE_EXPRESSION.fullmatch(source)
+    # whitespace control markers next to the delimiters would be read as operators of the expression
+    if match is not None and not {match["expression"][:1], match["expression"][-1:]} & {"-", "+"}:
+        try:
+            expression = jinja_env.compile_expression(match["expression"], undefined_to_none=False)
+        except jinja2.TemplateSyntaxError:
+            pass
+        else:
+            return lambda **context: str(expression(**context)) == "True"
+
+    template = get_template(source)
+    return lambda **context: template.render(**context) == "True"
+
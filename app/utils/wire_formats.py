@@ -0,0 +1,83 @@
+import json
+import zlib
+from typing import Any, Callable
+
+from fastapi.websockets import WebSocket
+from pydantic_core import to_json
+
+from app.config import config
+
+
+class CompressedFrame(bytes):
+    raw_size: int
+
+
+class WireFormat:
+    """
+    Encoding of frames exchanged with a websocket client, negotiated as a websocket subprotocol.
+
+    Formats are based on JSON, `encode_json_text` turns an already serialized JSON text into a frame without
+    serializing the data again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        encode: Callable[[Any], str | bytes],
+        decode: Callable[[str | bytes], Any],
+        encode_json_text: Callable[[str], str | bytes],
+    ):
+        self.name = name
+        self.subprotocol = f"overlays.{name}"
+        self.encode = encode
+        self.decode = decode
+        self.encode_json_text = encode_json_text
+
+
+def deflate_large(text: str) -> str | bytes:
+    """
+    Text frames of at least `compression_threshold` bytes compressed into a zlib stream sent as a binary frame.
+
+    Frames are compressed once and shared by every client, the server is run without permessage-deflate so they
+    aren't compressed again for each connection.
+    """
+    if len(text) < config.compression_threshold:
+        return text
+
+    frame = CompressedFrame(zlib.compress(text.encode()))
+    frame.raw_size = len(text)
+    return frame
+
+
+def inflate(message: str | bytes) -> str:
+    return zlib.decompress(message).decode() if isinstance(message, bytes) else message
+
+
+JSON = WireFormat(
+    "json",
+    encode=lambda data: to_json(data).decode(),
+    decode=json.loads,
+    encode_json_text=lambda text: text,
+)
+
+DEFLATED_JSON = WireFormat(
+    "json+deflate",
+    encode=lambda data: deflate_large(to_json(data).decode()),
+    decode=lambda message: json.loads(inflate(message)),
+    encode_json_text=deflate_large,
+)
+
+WIRE_FORMATS: dict[str, WireFormat] = {
+    JSON.subprotocol: JSON,
+    DEFLATED_JSON.subprotocol: DEFLATED_JSON,
+}
+
+
+def negotiate_wire_format(websocket: WebSocket) -> tuple[WireFormat, str | None]:
+    """
+    First of the subprotocols offered by the client that is supported, JSON without a subprotocol otherwise.
+    """
+    for subprotocol in websocket.scope.get("subprotocols", []):
+        if subprotocol in WIRE_FORMATS:
+            return WIRE_FORMATS[subprotocol], subprotocol
+    return JSON, None
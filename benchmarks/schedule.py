@@ -0,0 +1,78 @@
+"""
+Times schedule classification and state payload builds for events with schedules of growing length.
+
+Run from the directory the app runs in (it needs `config/config.toml`), for example::
+
+    python -m benchmarks.schedule 100 1000 5000
+"""
+import sys
+from datetime import datetime, timedelta, UTC
+from pathlib import PurePath
+from time import perf_counter
+from typing import Callable
+
+from app.models import Event, memoization_scope, State
+from app.state import get_state_update_for
+
+ROLES = ("schedule", "timer", "scene-schedule", "scene-title", "control")
+POSITIONS = 50
+
+
+def build_state(size: int) -> State:
+    starts = datetime(2026, 1, 1, 9, tzinfo=UTC)
+    event = Event.model_validate(
+        {
+            "path": PurePath(f"benchmarks/schedule-{size}"),
+            "name": f"Benchmark with {size} schedule items",
+            "logo_url": "https://example.com/logo.png",
+            "starts": starts,
+            "timezone": "UTC",
+            "schedule": [
+                {
+                    "type": "talk",
+                    "title": f"Talk {index}",
+                    "language": "en",
+                    "start": starts + timedelta(minutes=10 * index),
+                    "duration": 10,
+                    "timer_duration": 600,
+                    "room": f"R{index % 4}",
+                    "authors": [{"name": f"Speaker {index}"}],
+                }
+                for index in range(size)
+            ],
+            "views": {
+                "scene-schedule": {"screens": [{"type": "schedule"}]},
+                "scene-title": {"screens": [{"type": "presentation-title"}]},
+            },
+        },
+    )
+    return State(event=event)
+
+
+def measure(state: State, call: Callable[[], object]) -> float:
+    """
+    Mean time in microseconds of `call` with the ticker moved before each run, so no cached section is reused.
+    """
+    size = len(state.event.schedule)
+    total = 0.0
+    for position in range(POSITIONS):
+        state.move_to((position * size // POSITIONS, bool(position % 2)))
+        with memoization_scope():
+            start = perf_counter()
+            call()
+            total += perf_counter() - start
+    return total / POSITIONS * 1e6
+
+
+def main(sizes: list[int]) -> None:
+    print(f"{'items':>6} {'case':<28} {'mean us':>10}")
+    for size in sizes:
+        state = build_state(size)
+        print(f"{size:>6} {'State.schedule':<28} {measure(state, lambda: state.schedule):>10.1f}")
+        for role in ROLES:
+            label = f"payload {role}"
+            print(f"{size:>6} {label:<28} {measure(state, lambda: get_state_update_for(state, role)):>10.1f}")
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or [100, 1000, 5000])
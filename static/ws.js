@@ -13,6 +13,11 @@ const m_timerFlashing = ref(false);
 const m_now = ref(Date.now());
 const m_assignTarget = ref(null);
 const m_viewName = ref(null);
+let documentRevision = null;
+let currentDocument = null;
+let sessionToken = null;
+let eventBlobHash = null;
+let eventBlob = null;
 setInterval(() => m_now.value = Date.now(), 69);
 const m_ticker = ref(0);
 setInterval(() => m_ticker.value += 100, 100);
@@ -94,10 +99,29 @@ async function tickScreen() {
   await initScreen();
 }
 
+async function getEventBlob(hash, inlineEvent) {
+  // static part of the event is published under its content hash, fetch it only when it changes
+  if (hash !== eventBlobHash) {
+    if (inlineEvent !== undefined) {
+      eventBlob = inlineEvent;
+    } else {
+      const response = await fetch(`/v1/event-blobs/${encodeURIComponent(hash)}`);
+      if (!response.ok)
+        throw new Error(`cannot fetch event ${hash}: ${response.status}`);
+      eventBlob = await response.json();
+    }
+    eventBlobHash = hash;
+  }
+  return eventBlob;
+}
+
 async function parseEventData(data) {
   if (data.command && data.command.action === "config.force-reload" && m_role.value !== "control") {
     window.location.reload();
   }
+  if (data.event_hash !== undefined) {
+    data.event = await getEventBlob(data.event_hash, data.event);
+  }
   let status = data.status;
   if (status === "unassigned") {
     m_viewName.value = data.name;
@@ -106,6 +130,10 @@ async function parseEventData(data) {
   }
   if (status === "success")
     return;
+  if (status === "ping") {
+    sendMessage({"action": "pong"});
+    return;
+  }
   if (status === "timer.flash") {
     m_timerFlashing.value = true;
     setTimeout(() => m_timerFlashing.value = false, 3000);
@@ -149,15 +177,94 @@ async function parseEventData(data) {
   }
 
   if (status === "update") {
-    if (data.command === "event.tick" || data.command === "event.untick") {
+    // scheduled ticker updates send the action alone, updates caused by control commands send the whole command
+    const action = typeof data.command === "string" ? data.command : data.command?.action;
+    if (action === "event.tick" || action === "event.untick" || action === "event.jump") {
       await initScreen();
     }
   }
   console.log(data);
 }
 
+function applyPatch(target, operations) {
+  for (const operation of operations) {
+    if (operation.path === "") {
+      target = operation.value;
+      continue;
+    }
+    const tokens = operation.path.slice(1).split("/").map(
+      (token) => token.replaceAll("~1", "/").replaceAll("~0", "~")
+    );
+    const key = tokens.pop();
+    const parent = tokens.reduce((node, token) => node[token], target);
+    if (operation.op === "remove") {
+      if (Array.isArray(parent))
+        parent.splice(Number(key), 1);
+      else
+        delete parent[key];
+    } else if (operation.op === "add" && Array.isArray(parent)) {
+      parent.splice(Number(key), 0, operation.value);
+    } else {
+      parent[key] = operation.value;
+    }
+  }
+  return target;
+}
+
+async function parseFrame(data) {
+  if (data.status === "session") {
+    sessionToken = data.session;
+    return;
+  }
+  if (data.revision === undefined) {
+    await parseEventData(data);
+    return;
+  }
+  if (data.status === "patch") {
+    if (data.base !== documentRevision) {
+      // we missed something, ask for the full document
+      sendMessage({"action": "sync.resync"});
+      return;
+    }
+    currentDocument = applyPatch(currentDocument, data.patch);
+    documentRevision = data.revision;
+    // resumed session replaces the init frame
+    await parseEventData(data.resume
+      ? {...structuredClone(currentDocument), "rig": data.rig, "role": data.role, "status": "init"}
+      : {...structuredClone(currentDocument), "status": "update"});
+    return;
+  }
+  const {status, revision, target_roles, ...document} = data;
+  currentDocument = structuredClone(document);
+  documentRevision = revision;
+  await parseEventData(data);
+}
+
+function socketURL(wsURL) {
+  let url = `${wsURL}${wsURL.includes("?") ? "&" : "?"}protocol=delta`;
+  if (sessionToken !== null && documentRevision !== null) {
+    url += `&session=${encodeURIComponent(sessionToken)}&revision=${documentRevision}`;
+  }
+  return url;
+}
+
+// large frames come deflated as binary frames when the browser can inflate them
+const wireProtocols = typeof DecompressionStream === "undefined"
+  ? ["overlays.json"]
+  : ["overlays.json+deflate", "overlays.json"];
+
+async function decodeFrame(frame) {
+  if (typeof frame === "string")
+    return JSON.parse(frame);
+  const stream = new Blob([frame]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return JSON.parse(await new Response(stream).text());
+}
+
+let pendingFrames = Promise.resolve();
+
 const openSocket = (wsURL, waitTimer, waitSeed, multiplier) => {
-  ws = new WebSocket(wsURL);
+  ws = new WebSocket(socketURL(wsURL), wireProtocols);
+  ws.binaryType = "arraybuffer";
   console.log(`trying to connect to: ${ws.url}`);
 
   ws.onopen = () => {
@@ -166,11 +273,14 @@ const openSocket = (wsURL, waitTimer, waitSeed, multiplier) => {
 
     ws.onclose = () => {
       console.log(`connection closed to: ${ws.url}`);
-      openSocket(ws.url, waitTimer, waitSeed, multiplier);
+      openSocket(wsURL, waitTimer, waitSeed, multiplier);
     };
 
-    ws.onmessage = async (event) => {
-      await parseEventData(JSON.parse(event.data));
+    ws.onmessage = (event) => {
+      // inflating is asynchronous, keep frames in the order they came in
+      pendingFrames = pendingFrames
+        .then(async () => await parseFrame(await decodeFrame(event.data)))
+        .catch((error) => console.log(error));
     };
   };
 
@@ -180,7 +290,7 @@ const openSocket = (wsURL, waitTimer, waitSeed, multiplier) => {
       waitTimer = waitTimer * multiplier;
     console.log(`error opening connection ${ws.url}, next attemp in : ${waitTimer / 1000} seconds`);
     setTimeout(() => {
-      openSocket(ws.url, waitTimer, waitSeed, multiplier)
+      openSocket(wsURL, waitTimer, waitSeed, multiplier)
     }, waitTimer);
   }
 }